@@ -13,36 +13,105 @@ Usage:
         "heading": 45.2,
         "speed": 32.5,
         "camera_width": 1280,
-        "camera_height": 720
+        "camera_height": 720,
+        "session_id": "car-1",      (optional, enables windowed tracking)
+        "track": "losail",          (optional, see TRACK REGISTRY)
+        "track_version": "2025-02", (optional, latest if omitted)
+        "camera": "gopro",          (optional, see CAMERA_PROFILES)
+        "timestamp": 1718000000.25, (optional, sample time: epoch s/ms or ISO 8601)
+        "latency_ms": 120           (optional, expected delivery latency)
     }
 
+    With a timestamp, the overlay is drawn for the pose predicted at
+    now + latency_ms along the racing line, and the response reports how far
+    it extrapolated (predicted_ms, predicted_m).
+
+    Send Accept: application/octet-stream for the compact binary encoding
+    (see encode_overlay_binary); with a session_id, also send "delta_base"
+    to receive points delta-encoded against that earlier response.
+
+    GET /api/racing_line/metrics for per-stage latency percentiles and
+    counters in Prometheus text format (?format=json for a compact view).
+
+    Batch: POST a list of {latitude, longitude, heading, speed} samples, or
+    {"samples": [...], "camera_width": ..., "camera_height": ...}, to get a
+    list of results back. Send Accept: application/x-ndjson to receive one
+    result per line as they are computed.
+
 Returns:
     {
         "overlay_points": [[x1, y1], [x2, y2], ...],
         "target_speed": 28.5,
         "deviation_m": 2.3,
         "segment": "Q2",
+        "segment_id": 1,
         "efficiency": 156.7
     }
 """
 
+import bisect
+import hashlib
 import json
 import math
+import os
+import re
+import struct
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
 from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
 
 # ============== RACING LINE DATA ==============
-# This will be loaded from ideal_racing_line.json
-# For now, using Lusail Short Circuit ideal line
+# Loaded lazily, once, from the compiled artifact (see utils/build_racing_line.py)
+# when the line is large enough for that to be faster, else from
+# ideal_racing_line.json, then the built-in Lusail line
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIRS = ['.', API_DIR, os.path.join(API_DIR, '..', 'app')]
+RACING_LINE_JSON = 'ideal_racing_line.json'
+RACING_LINE_ARTIFACT = 'ideal_racing_line.npz'
+ARTIFACT_VERSION = 1
+ARTIFACT_MIN_JSON_BYTES = 256 * 1024  # Below this, parsing the JSON beats np.load (zipfile import)
 
 RACING_LINE = None
 SEGMENTS = None
+TRACK = None
+
+def find_data_file(name):
+    """First existing path for a data file across DATA_DIRS."""
+    for directory in DATA_DIRS:
+        path = os.path.join(directory, name)
+        if os.path.isfile(path):
+            return path
+    return None
+
+def prefer_artifact(source_path):
+    """Whether loading a compiled artifact beats parsing its source JSON (or there is none)."""
+    return source_path is None or os.path.getsize(source_path) >= ARTIFACT_MIN_JSON_BYTES
 
 def load_racing_line():
-    """Load racing line data from JSON."""
-    global RACING_LINE, SEGMENTS
+    """Load racing line data from the compiled artifact or JSON."""
+    global RACING_LINE, SEGMENTS, TRACK
+
+    artifact_path = find_data_file(RACING_LINE_ARTIFACT)
+    json_path = find_data_file(RACING_LINE_JSON)
+    if artifact_path and prefer_artifact(json_path):
+        try:
+            # Falls through to the JSON if that was edited since the build
+            TRACK, SEGMENTS = load_racing_line_artifact(artifact_path, json_path)
+            RACING_LINE = None  # Source points are not kept in the artifact
+            RESPONSE_CACHE.clear()
+            print(f"Loaded racing line artifact: {len(TRACK)} points, {len(SEGMENTS)} segments")
+            return
+        except (OSError, KeyError, ValueError) as e:
+            print(f"Ignoring racing line artifact {artifact_path}: {e}")
 
     try:
-        with open('ideal_racing_line.json', 'r') as f:
+        with open(json_path or RACING_LINE_JSON, 'r') as f:
             data = json.load(f)
             RACING_LINE = data.get('racing_line', [])
             SEGMENTS = data.get('segments', [])
@@ -53,6 +122,35 @@ def load_racing_line():
         RACING_LINE = generate_default_racing_line()
         SEGMENTS = generate_default_segments()
 
+    TRACK = TrackGeometry.from_racing_line(RACING_LINE) if RACING_LINE else None
+    if TRACK:
+        TRACK.set_segments(SEGMENTS)
+    RESPONSE_CACHE.clear()
+
+def set_racing_line(racing_line, segments=None, spacing_m=None):
+    """
+    Replace the loaded racing line, e.g. with a densified or test line.
+    spacing_m overrides RESAMPLE_SPACING_M (benchmarks vary it).
+    """
+    global RACING_LINE, SEGMENTS, TRACK
+
+    RACING_LINE = racing_line
+    SEGMENTS = segments if segments is not None else []
+    TRACK = TrackGeometry.from_racing_line(racing_line, spacing_m or RESAMPLE_SPACING_M)
+    TRACK.set_segments(SEGMENTS)
+    RESPONSE_CACHE.clear()
+
+def get_track(track_id=None, version=None):
+    """
+    Track geometry, loaded on first use. Without a track id this is the
+    default racing line above; named tracks come from the TRACK REGISTRY.
+    """
+    if track_id is not None:
+        return REGISTRY.get(track_id, version)
+    if TRACK is None:
+        load_racing_line()
+    return TRACK
+
 def generate_default_racing_line():
     """Generate default racing line for Lusail Short Circuit."""
     # Based on your notebook's track outline
@@ -133,6 +231,9 @@ def generate_default_segments():
     ]
 
 # ============== GPS MATH ==============
+WGS84_A = 6378137.0                 # Semi-major axis (m)
+WGS84_E2 = 6.69437999014e-3         # First eccentricity squared
+
 def haversine(lat1, lon1, lat2, lon2):
     """Calculate distance between two GPS points in kilometers."""
     R = 6371  # Earth's radius in km
@@ -143,23 +244,872 @@ def haversine(lat1, lon1, lat2, lon2):
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     return R * c
 
+def geodetic_to_enu(lat, lon, lat0, lon0):
+    """
+    Convert GPS coordinates to local east/north metres on the WGS84 tangent
+    plane anchored at (lat0, lon0). Accepts scalars or NumPy arrays.
+    """
+    lat = np.radians(lat)
+    lon = np.radians(lon)
+    lat0 = math.radians(lat0)
+    lon0 = math.radians(lon0)
+
+    # Geodetic -> ECEF (on the ellipsoid surface)
+    n = WGS84_A / np.sqrt(1 - WGS84_E2 * np.sin(lat)**2)
+    x = n * np.cos(lat) * np.cos(lon)
+    y = n * np.cos(lat) * np.sin(lon)
+    z = n * (1 - WGS84_E2) * np.sin(lat)
+
+    n0 = WGS84_A / math.sqrt(1 - WGS84_E2 * math.sin(lat0)**2)
+    dx = x - n0 * math.cos(lat0) * math.cos(lon0)
+    dy = y - n0 * math.cos(lat0) * math.sin(lon0)
+    dz = z - n0 * (1 - WGS84_E2) * math.sin(lat0)
+
+    # ECEF offset -> ENU
+    sin_lat0, cos_lat0 = math.sin(lat0), math.cos(lat0)
+    sin_lon0, cos_lon0 = math.sin(lon0), math.cos(lon0)
+    east = -sin_lon0 * dx + cos_lon0 * dy
+    north = -sin_lat0 * cos_lon0 * dx - sin_lat0 * sin_lon0 * dy + cos_lat0 * dz
+    return east, north
+
+# ============== SPATIAL INDEX ==============
+GRID_CELL_M = 25.0          # Grid cell size in metres
+GRID_MAX_RINGS = 8          # Beyond this many rings fall back to a linear scan
+
+class SpatialGrid:
+    """
+    Uniform grid over racing line points in local ENU metres.
+
+    Points are bucketed into square cells; queries visit cells ring by ring
+    outwards and stop once no unvisited cell can hold a closer point.
+    """
+
+    def __init__(self, east, north, cell_m=GRID_CELL_M):
+        self.east = east
+        self.north = north
+        self.cell_m = cell_m
+
+        cols = np.floor(east / cell_m).astype(np.int64)
+        rows = np.floor(north / cell_m).astype(np.int64)
+
+        # Sort points by cell, then slice out each cell's run of indices
+        order = np.lexsort((rows, cols))
+        keys = np.stack([cols[order], rows[order]], axis=1)
+        starts = np.flatnonzero(np.any(np.diff(keys, axis=0) != 0, axis=1)) + 1
+        bounds = np.concatenate([[0], starts, [len(order)]])
+        # lexsort is stable, so indices within each cell stay ascending
+        self.cells = {
+            (int(keys[a, 0]), int(keys[a, 1])): order[a:b]
+            for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+        }
+
+        self.min_col, self.max_col = int(cols.min()), int(cols.max())
+        self.min_row, self.max_row = int(rows.min()), int(rows.max())
+
+    def ring(self, col, row, r):
+        """Index arrays of non-empty cells at Chebyshev distance r."""
+        if r == 0:
+            cell = self.cells.get((col, row))
+            return [cell] if cell is not None else []
+        found = []
+        for c in range(col - r, col + r + 1):
+            for rr in (row - r, row + r):
+                cell = self.cells.get((c, rr))
+                if cell is not None:
+                    found.append(cell)
+        for rr in range(row - r + 1, row + r):
+            for c in (col - r, col + r):
+                cell = self.cells.get((c, rr))
+                if cell is not None:
+                    found.append(cell)
+        return found
+
+    def nearest(self, east, north):
+        """
+        Nearest point index and its distance in metres.
+        Ties resolve to the lowest index, matching a linear scan.
+        """
+        col = int(math.floor(east / self.cell_m))
+        row = int(math.floor(north / self.cell_m))
+        outside = max(self.min_col - col, col - self.max_col,
+                      self.min_row - row, row - self.max_row, 0)
+        if outside > GRID_MAX_RINGS:
+            return self.linear_nearest(east, north)
+
+        max_r = max(col - self.min_col, self.max_col - col,
+                    row - self.min_row, self.max_row - row)
+        best_d2 = float('inf')
+        best_idx = 0
+
+        for r in range(max_r + 1):
+            cells = self.ring(col, row, r)
+            if cells:
+                idx = np.concatenate(cells)
+                d2 = (self.east[idx] - east)**2 + (self.north[idx] - north)**2
+                ring_best = float(d2.min())
+                ring_idx = int(idx[d2 == ring_best].min())
+                if ring_best < best_d2 or (ring_best == best_d2 and ring_idx < best_idx):
+                    best_d2 = ring_best
+                    best_idx = ring_idx
+
+            # Every point not yet visited is at least r cells away
+            bound = r * self.cell_m
+            if bound * bound > best_d2:
+                break
+
+        return best_idx, math.sqrt(best_d2)
+
+    def within(self, east, north, radius):
+        """Indices of all points in cells overlapping a square of +-radius."""
+        c0 = max(int(math.floor((east - radius) / self.cell_m)), self.min_col)
+        c1 = min(int(math.floor((east + radius) / self.cell_m)), self.max_col)
+        r0 = max(int(math.floor((north - radius) / self.cell_m)), self.min_row)
+        r1 = min(int(math.floor((north + radius) / self.cell_m)), self.max_row)
+        found = [self.cells[cell] for cell in
+                 ((c, r) for c in range(c0, c1 + 1) for r in range(r0, r1 + 1))
+                 if cell in self.cells]
+        return np.concatenate(found) if found else np.empty(0, dtype=np.int64)
+
+    def linear_nearest(self, east, north):
+        """Full scan fallback for queries far from the track."""
+        d2 = (self.east - east)**2 + (self.north - north)**2
+        best_idx = int(np.argmin(d2))
+        return best_idx, math.sqrt(float(d2[best_idx]))
+
+# ============== SESSIONS ==============
+SESSION_MAX = 512           # Most sessions tracked at once (LRU beyond that)
+SESSION_IDLE_S = 300        # Sessions idle longer than this are evicted
+SESSION_WINDOW_BACK_M = 10  # Windowed search reaches this far behind the last match
+SESSION_WINDOW_AHEAD_M = 60 # ...and this far ahead of it
+SESSION_JUMP_M = 15         # Windowed matches farther than this trigger a global search
+
+class Session:
+    """Per-client tracking state."""
+    __slots__ = ('idx', 'last_seen', 'seq', 'points')
+
+    def __init__(self):
+        self.idx = None         # Last matched racing line index
+        self.last_seen = 0.0
+        self.seq = 0            # Sequence number of the last binary response
+        self.points = None      # Overlay points of the last binary response
+
+class SessionStore:
+    """
+    Tracking state per client session.
+    Bounded LRU with idle eviction so memory stays flat with many clients.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX, idle_s=SESSION_IDLE_S):
+        self.max_sessions = max_sessions
+        self.idle_s = idle_s
+        self.sessions = OrderedDict()  # session_id -> Session
+        self.lock = threading.Lock()
+
+    def evict_idle(self, now):
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_seen <= self.idle_s:
+                break
+            self.sessions.popitem(last=False)
+
+    def touch(self, session_id):
+        """Session for an id, created if needed and marked most recent."""
+        now = time.monotonic()
+        self.evict_idle(now)
+        session = self.sessions.get(session_id)
+        if session is None:
+            session = self.sessions[session_id] = Session()
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        self.sessions.move_to_end(session_id)
+        session.last_seen = now
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            self.evict_idle(time.monotonic())
+            session = self.sessions.get(session_id)
+            return session.idx if session else None
+
+    def put(self, session_id, idx):
+        with self.lock:
+            self.touch(session_id).idx = idx
+
+    def swap_points(self, session_id, points):
+        """
+        Record the points of a new binary response.
+        Returns (new_seq, previous_seq, previous_points).
+        """
+        with self.lock:
+            session = self.touch(session_id)
+            previous = session.seq, session.points
+            session.seq = (session.seq + 1) & 0xFFFF
+            session.points = points
+            return (session.seq,) + previous
+
+    def __len__(self):
+        return len(self.sessions)
+
+SESSIONS = SessionStore()
+
+# ============== RESPONSE CACHE ==============
+CACHE_SIZE = 1024           # Cached overlay results (0 disables the cache)
+CACHE_POS_M = 0.25          # Position quantisation grid in metres
+CACHE_HEADING_DEG = 1.0     # Heading bin width in degrees
+CACHE_SPEED_KMH = 0.5       # Speed bin width in km/h
+
+class OverlayCache:
+    """
+    LRU cache of overlay results keyed on quantised car pose.
+    Coarser bins raise the hit rate at the cost of overlay accuracy.
+    """
+
+    def __init__(self, max_size=CACHE_SIZE, pos_m=CACHE_POS_M,
+                 heading_deg=CACHE_HEADING_DEG, speed_kmh=CACHE_SPEED_KMH):
+        self.max_size = max_size
+        self.pos_m = pos_m
+        self.heading_deg = heading_deg
+        self.speed_kmh = speed_kmh
+        self.entries = OrderedDict()  # key -> (nearest_idx, result)
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def key(self, track_key, east, north, heading, speed, cam_width, cam_height, camera=None):
+        heading_bins = max(int(round(360 / self.heading_deg)), 1)
+        return (
+            track_key,
+            int(round(east / self.pos_m)),
+            int(round(north / self.pos_m)),
+            int(round((heading % 360) / self.heading_deg)) % heading_bins,
+            int(round(speed / self.speed_kmh)),
+            cam_width,
+            cam_height,
+            camera
+        )
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, nearest_idx, result):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.entries[key] = (nearest_idx, result)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0
+            }
+
+RESPONSE_CACHE = OverlayCache()
+
+# ============== METRICS ==============
+METRICS_WINDOW = 2048       # Recent samples per stage kept for percentiles
+
+class Metrics:
+    """
+    Hot-path stage timings and request counters.
+
+    Each stage keeps a fixed ring buffer of its most recent durations, so
+    recording is O(1) and percentiles are only computed when scraped.
+    Counts are per process: each serverless instance reports its own.
+    """
+
+    STAGES = ('parse', 'nearest', 'projection', 'serialize', 'total')
+    COUNTERS = ('requests', 'errors', 'off_track', 'batch_requests', 'batch_samples',
+                'stream_samples', 'stream_sent', 'stream_coalesced')
+    QUANTILES = (0.5, 0.95, 0.99)
+
+    def __init__(self, window=METRICS_WINDOW):
+        self.window = window
+        self.samples = {stage: np.zeros(window) for stage in self.STAGES}
+        self.count = dict.fromkeys(self.STAGES, 0)
+        self.total = dict.fromkeys(self.STAGES, 0.0)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        self.lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            self.samples[stage][self.count[stage] % self.window] = seconds
+            self.count[stage] += 1
+            self.total[stage] += seconds
+
+    def incr(self, counter, n=1):
+        with self.lock:
+            self.counters[counter] += n
+
+    def quantiles(self, stage):
+        """Recent p50/p95/p99 in seconds, or None before any samples."""
+        with self.lock:
+            recent = self.samples[stage][:min(self.count[stage], self.window)].copy()
+        if not len(recent):
+            return None
+        return dict(zip(self.QUANTILES, np.quantile(recent, self.QUANTILES).tolist()))
+
+    def to_dict(self):
+        """Compact JSON view, latencies in milliseconds."""
+        stages = {}
+        for stage in self.STAGES:
+            q = self.quantiles(stage) or {}
+            stages[stage] = {
+                'count': self.count[stage],
+                **{f'p{int(k * 100)}_ms': round(v * 1000, 3) for k, v in q.items()}
+            }
+        return {
+            'counters': dict(self.counters),
+            'stages': stages,
+            'cache': RESPONSE_CACHE.stats(),
+            'sessions': len(SESSIONS)
+        }
+
+    def to_prometheus(self):
+        """Prometheus text exposition format."""
+        lines = []
+        for counter in self.COUNTERS:
+            name = f'racing_line_{counter}_total'
+            lines += [f'# TYPE {name} counter', f'{name} {self.counters[counter]}']
+
+        cache = RESPONSE_CACHE.stats()
+        lines += ['# TYPE racing_line_cache_hits_total counter',
+                  f'racing_line_cache_hits_total {cache["hits"]}',
+                  '# TYPE racing_line_cache_misses_total counter',
+                  f'racing_line_cache_misses_total {cache["misses"]}',
+                  '# TYPE racing_line_sessions gauge',
+                  f'racing_line_sessions {len(SESSIONS)}']
+
+        name = 'racing_line_stage_seconds'
+        lines.append(f'# TYPE {name} summary')
+        for stage in self.STAGES:
+            for q, value in (self.quantiles(stage) or {}).items():
+                lines.append(f'{name}{{stage="{stage}",quantile="{q}"}} {value:.9f}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {self.total[stage]:.9f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {self.count[stage]}')
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics()
+
+# ============== TRACK GEOMETRY ==============
+RESAMPLE_SPACING_M = 1.0    # Station spacing of the resampled racing line
+LAP_CLOSE_TOLERANCE_M = 1.0 # First/last points closer than this already close the lap
+
+class TrackGeometry:
+    """
+    Racing line converted once into a local east-north-up tangent plane
+    anchored at the track centre, so the request path works in metres.
+
+    The closed lap is parameterised by arc length (station) and resampled to
+    RESAMPLE_SPACING_M, so per-request work does not depend on how densely
+    the source line was recorded. All state lives in flat arrays (see
+    ARRAYS) so it can be saved to and loaded from the compiled artifact.
+    """
+
+    # Columns of the packed 'line' array: one row per attribute, one column per point
+    LINE_ROWS = ('station', 'east', 'north', 'lat', 'lon', 'target_speed')
+    ARRAYS = ('meta', 'line', 'line_segment', 'segment_names')
+
+    def __init__(self, arrays):
+        self.lat0, self.lon0, self.lap_length, source_count = (float(v) for v in arrays['meta'])
+        self.source_count = int(source_count)
+        (self.station, self.east, self.north,
+         self.lat, self.lon, self.target_speed) = arrays['line']
+        self.segment_id, self.segment_name_idx = arrays['line_segment']
+        self.segment_names = [str(name) for name in arrays['segment_names']]
+
+        # Polyline edges from each point to the next, closing the lap
+        self.spacing = self.lap_length / len(self.station)
+        # Packed per edge (start east, start north, delta east, delta north,
+        # 1 / squared length) so candidate edges are gathered in one pass
+        edge_east = np.roll(self.east, -1) - self.east
+        edge_north = np.roll(self.north, -1) - self.north
+        self.edges = np.stack([self.east, self.north, edge_east, edge_north,
+                               1.0 / np.maximum(edge_east**2 + edge_north**2, 1e-12)])
+
+        self.grid = SpatialGrid(self.east, self.north)
+        self.key = None         # (track_id, version) for registry tracks
+        self.set_segments([])
+
+    @classmethod
+    def from_racing_line(cls, racing_line, spacing_m=RESAMPLE_SPACING_M):
+        """Build geometry from a list of racing line point dicts."""
+        src_lat = np.array([p['lat'] for p in racing_line], dtype=np.float64)
+        src_lon = np.array([p['lon'] for p in racing_line], dtype=np.float64)
+
+        # Anchor at the centre of the bounding box
+        lat0 = float(src_lat.min() + src_lat.max()) / 2
+        lon0 = float(src_lon.min() + src_lon.max()) / 2
+        src_east, src_north = geodetic_to_enu(src_lat, src_lon, lat0, lon0)
+
+        # Close the lap back to the start/finish if the data does not
+        src_vertex = np.arange(len(racing_line))
+        if math.hypot(src_east[-1] - src_east[0], src_north[-1] - src_north[0]) > LAP_CLOSE_TOLERANCE_M:
+            src_lat, src_lon = np.append(src_lat, src_lat[0]), np.append(src_lon, src_lon[0])
+            src_east, src_north = np.append(src_east, src_east[0]), np.append(src_north, src_north[0])
+            src_vertex = np.append(src_vertex, 0)
+
+        # Cumulative arc length along the source polyline
+        seg_len = np.hypot(np.diff(src_east), np.diff(src_north))
+        src_station = np.concatenate([[0.0], np.cumsum(seg_len)])
+        lap_length = float(src_station[-1])
+
+        # Resample at fixed spacing; the lap end coincides with station 0
+        count = max(int(math.ceil(lap_length / spacing_m - 1e-9)), 2)
+        station = np.arange(count, dtype=np.float64) * (lap_length / count)
+
+        # Each resampled point takes its attributes from the vertex starting its span
+        span = np.searchsorted(src_station, station, side='right') - 1
+        source_idx = src_vertex[np.clip(span, 0, len(src_vertex) - 1)]
+
+        names = [str(p.get('segment_name', 'N/A')) for p in racing_line]
+        segment_names = sorted(set(names))
+        target_speed = np.array([p.get('target_speed', 0) for p in racing_line], dtype=np.float64)
+        segment_id = np.array([p.get('segment_id', 0) for p in racing_line], dtype=np.int16)
+        name_idx = np.array([segment_names.index(name) for name in names], dtype=np.int16)
+
+        return cls({
+            'meta': np.array([lat0, lon0, lap_length, len(racing_line)], dtype=np.float64),
+            'line': np.stack([
+                station,
+                np.interp(station, src_station, src_east),
+                np.interp(station, src_station, src_north),
+                np.interp(station, src_station, src_lat),
+                np.interp(station, src_station, src_lon),
+                target_speed[source_idx]
+            ]),
+            'line_segment': np.stack([segment_id[source_idx], name_idx[source_idx]]),
+            'segment_names': np.array(segment_names)
+        })
+
+    def set_segments(self, segments):
+        """
+        Attach segment dicts. When every segment has start_m, boundaries are
+        sorted and scaled to this line's lap length for lookup by station.
+        """
+        self.segments = segments or []
+        starts = [seg.get('start_m') for seg in self.segments]
+        self.segment_order = None
+        if self.segments and all(isinstance(v, (int, float)) for v in starts):
+            # Boundaries are measured on the source lap, which may differ in length
+            source_lap = max(seg.get('end_m', 0) for seg in self.segments) or self.lap_length
+            self.segment_order = sorted(range(len(starts)), key=starts.__getitem__)
+            self.segment_start = [starts[k] * self.lap_length / source_lap
+                                  for k in self.segment_order]
+
+    def segment_at(self, station_m, i):
+        """
+        Segment dict containing a station, by bisecting the start_m
+        boundaries; without them, the segment_id of point i.
+        """
+        if self.segment_order is not None:
+            # Before the first boundary wraps to the last segment of the lap
+            k = bisect.bisect_right(self.segment_start, station_m) - 1
+            return self.segments[self.segment_order[k]]
+        segment_id = int(self.segment_id[i])
+        return self.segments[segment_id] if 0 <= segment_id < len(self.segments) else {}
+
+    def to_arrays(self):
+        """Packed arrays suitable for np.savez, inverse of __init__."""
+        return {
+            'meta': np.array([self.lat0, self.lon0, self.lap_length, self.source_count],
+                             dtype=np.float64),
+            'line': np.stack([getattr(self, row) for row in self.LINE_ROWS]),
+            'line_segment': np.stack([self.segment_id, self.segment_name_idx]),
+            'segment_names': np.array(self.segment_names)
+        }
+
+    def __len__(self):
+        return len(self.station)
+
+    def point(self, i):
+        """Resampled point i with the attributes of its source vertex."""
+        target_speed = float(self.target_speed[i])
+        return {
+            'lat': float(self.lat[i]),
+            'lon': float(self.lon[i]),
+            'target_speed': int(target_speed) if target_speed.is_integer() else target_speed,
+            'segment_name': self.segment_names[self.segment_name_idx[i]],
+            'segment_id': int(self.segment_id[i]),
+            'station_m': float(self.station[i])
+        }
+
+    def to_enu(self, lat, lon):
+        """Car position in this track's local frame (metres)."""
+        east, north = geodetic_to_enu(lat, lon, self.lat0, self.lon0)
+        return float(east), float(north)
+
+    def lookahead(self, i, distance_m):
+        """
+        Indices of points whose station lies within distance_m ahead of
+        point i, wrapping across the start/finish line.
+        """
+        end = self.station[i] + min(distance_m, self.lap_length)
+        if end < self.lap_length:
+            stop = int(np.searchsorted(self.station, end, side='right'))
+            return np.arange(i, stop)
+        stop = int(np.searchsorted(self.station, end - self.lap_length, side='right'))
+        return np.concatenate([np.arange(i, len(self.station)), np.arange(0, min(stop, i))])
+
+    def nearest_in_window(self, east, north, i, back_m, ahead_m):
+        """
+        Nearest point among those from back_m behind to ahead_m ahead of
+        point i (wrapping). Returns (index, distance_m, at_front_edge).
+        """
+        n = len(self.station)
+        spacing = self.lap_length / n
+        back = min(int(back_m / spacing), n - 1)
+        ahead = min(int(ahead_m / spacing), n - 1 - back)
+        idx = np.arange(i - back, i + ahead + 1) % n
+
+        d2 = (self.east[idx] - east)**2 + (self.north[idx] - north)**2
+        best = int(np.argmin(d2))
+        return int(idx[best]), math.sqrt(float(d2[best])), best == len(idx) - 1
+
+    def at_station(self, station_m):
+        """Position (east, north) and unit direction (east, north) of the line at a station."""
+        pos = (station_m % self.lap_length) / self.spacing
+        k = int(pos)
+        start_e, start_n, edge_e, edge_n, inv_len2 = self.edges[:, k % len(self.station)]
+        t = pos - k
+        inv_len = math.sqrt(inv_len2)
+        return start_e + t * edge_e, start_n + t * edge_n, edge_e * inv_len, edge_n * inv_len
+
+    def edge_distance(self, east, north, edges):
+        """Squared distances to the given polyline edges and the clamped position along each."""
+        start_e, start_n, edge_e, edge_n, inv_len2 = self.edges[:, edges]
+        rel_e, rel_n = east - start_e, north - start_n
+        t = np.clip((rel_e * edge_e + rel_n * edge_n) * inv_len2, 0.0, 1.0)
+        d2 = (rel_e - t * edge_e)**2 + (rel_n - t * edge_n)**2
+        return d2, t
+
+    def project(self, east, north, i, vertex_dist):
+        """
+        Perpendicular distance from a position to the racing line and the
+        station of its foot on the edges either side of matched point i.
+        vertex_dist is the distance to point i.
+        """
+        # The closest edge has an end within half an edge of its closest
+        # point, so within vertex_dist + spacing / 2 of the position.
+        # Edge -1 is the one closing the lap.
+        near = self.grid.within(east, north, vertex_dist + self.spacing / 2)
+        edges = np.concatenate([[i - 1, i], near, near - 1])
+        d2, t = self.edge_distance(east, north, edges)
+
+        k = 0 if d2[0] < d2[1] else 1
+        station = (self.station[edges[k]] + t[k] * self.spacing) % self.lap_length
+        return math.sqrt(float(d2.min())), float(station)
+
+    def match_batch(self, east, north, max_cells=None):
+        """
+        Nearest point indices, perpendicular deviations and stations for
+        arrays of positions, as project() after a global nearest search.
+        Brute force over points in chunks of at most max_cells evaluations;
+        only edges next to points within reach are measured.
+        """
+        n = len(self.station)
+        chunk = max((max_cells or BATCH_MAX_CELLS) // n, 1)
+        nearest = np.empty(len(east), dtype=np.int64)
+        deviation = np.empty(len(east), dtype=np.float64)
+        for start in range(0, len(east), chunk):
+            e = east[start:start + chunk]
+            nn = north[start:start + chunk]
+            d2 = (self.east[None, :] - e[:, None])**2 + (self.north[None, :] - nn[:, None])**2
+            best = np.argmin(d2, axis=1)
+            rows = np.arange(len(best))
+            reach = (np.sqrt(d2[rows, best]) + self.spacing / 2)**2
+
+            # Candidate edges start at, or end at, a point within reach
+            near = d2 <= reach[:, None]
+            row, col = np.nonzero(near | np.roll(near, -1, axis=1))
+            edge_d2, _ = self.edge_distance(e[row], nn[row], col)
+            row_start = np.searchsorted(row, rows)
+            nearest[start:start + chunk] = best
+            deviation[start:start + chunk] = np.sqrt(np.minimum.reduceat(edge_d2, row_start))
+
+        local = np.stack([nearest - 1, nearest], axis=1)
+        local_d2, local_t = self.edge_distance(east[:, None], north[:, None], local)
+        k = np.argmin(local_d2, axis=1)
+        rows = np.arange(len(east))
+        station = (self.station[local[rows, k]] + local_t[rows, k] * self.spacing) % self.lap_length
+        return nearest, deviation, station
+
+    def match(self, east, north, session_id=None):
+        """
+        Nearest point index and distance for a car position. With a session
+        id, search a window ahead of the session's last match and fall back
+        to the global index if the car has jumped.
+        """
+        # Sessions are per track, so switching tracks starts a fresh search
+        if session_id is not None:
+            session_id = (self.key, session_id)
+        last_idx = SESSIONS.get(session_id) if session_id is not None else None
+        if last_idx is not None and last_idx < len(self.station):
+            idx, dist, at_edge = self.nearest_in_window(
+                east, north, last_idx, SESSION_WINDOW_BACK_M, SESSION_WINDOW_AHEAD_M)
+            if at_edge or dist > SESSION_JUMP_M:
+                idx, dist = self.grid.nearest(east, north)
+        else:
+            idx, dist = self.grid.nearest(east, north)
+
+        if session_id is not None:
+            SESSIONS.put(session_id, idx)
+        return idx, dist
+
+# ============== COMPILED ARTIFACT ==============
+def validate_racing_line(data):
+    """Raise ValueError if racing line JSON is unusable."""
+    racing_line = data.get('racing_line')
+    if not isinstance(racing_line, list) or len(racing_line) < 2:
+        raise ValueError('racing_line must be a list of at least 2 points')
+
+    segment_ids = {s.get('id', i) for i, s in enumerate(data.get('segments', []))}
+    for i, point in enumerate(racing_line):
+        lat, lon = point.get('lat'), point.get('lon')
+        if not isinstance(lat, (int, float)) or not -90 <= lat <= 90:
+            raise ValueError(f'racing_line[{i}]: invalid lat {lat!r}')
+        if not isinstance(lon, (int, float)) or not -180 <= lon <= 180:
+            raise ValueError(f'racing_line[{i}]: invalid lon {lon!r}')
+        if segment_ids and point.get('segment_id', 0) not in segment_ids:
+            raise ValueError(f'racing_line[{i}]: unknown segment_id {point.get("segment_id")!r}')
+
+def compile_racing_line(json_path, artifact_path):
+    """
+    Validate racing line JSON and write the precomputed geometry artifact:
+    resampled lat/lon and ENU coordinates, station, per-point target speed
+    and segment, and the segments (start_m/end_m included). Per-segment
+    paths are dropped.
+    """
+    with open(json_path, 'rb') as f:
+        raw = f.read()
+    data = json.loads(raw)
+    validate_racing_line(data)
+
+    track = TrackGeometry.from_racing_line(data['racing_line'])
+    segments = [{k: v for k, v in s.items() if k != 'path'} for s in data.get('segments', [])]
+
+    np.savez_compressed(
+        artifact_path,
+        version=np.array(ARTIFACT_VERSION),
+        source_sha256=np.array(hashlib.sha256(raw).hexdigest()),
+        segments_json=np.array(json.dumps(segments)),
+        **track.to_arrays()
+    )
+    return track, segments
+
+def load_racing_line_artifact(path, source_path=None):
+    """
+    Load (TrackGeometry, segments) from a compiled artifact. With the
+    source JSON's path, raises ValueError if the artifact was built from
+    a different version of it (stale).
+    """
+    with np.load(path, allow_pickle=False) as data:
+        version = int(data['version'])
+        if version != ARTIFACT_VERSION:
+            raise ValueError(f'artifact version {version}, expected {ARTIFACT_VERSION}')
+        if source_path and os.path.isfile(source_path):
+            with open(source_path, 'rb') as f:
+                source_sha256 = hashlib.sha256(f.read()).hexdigest()
+            if str(data['source_sha256']) != source_sha256:
+                raise ValueError(f'stale, {os.path.basename(source_path)} changed since it was built')
+        arrays = {name: data[name] for name in TrackGeometry.ARRAYS}
+        segments = json.loads(str(data['segments_json']))
+    track = TrackGeometry(arrays)
+    track.set_segments(segments)
+    return track, segments
+
 def find_nearest_point(lat, lon):
     """Find nearest point on racing line and its index."""
-    if not RACING_LINE:
+    if get_track() is None:
         return None, 0, float('inf')
 
-    min_dist = float('inf')
-    nearest_idx = 0
-    nearest_point = None
+    nearest_idx, dist_m = TRACK.grid.nearest(*TRACK.to_enu(lat, lon))
+    nearest_point = TRACK.point(nearest_idx)
+
+    return nearest_point, nearest_idx, dist_m  # Distance in meters
+
+# ============== TRACK REGISTRY ==============
+# Other venues and racing line versions, loaded side by side on demand from
+#     <data dir>/tracks/<track_id>/<version>.npz   (compiled, preferred)
+#     <data dir>/tracks/<track_id>/<version>.json  (same format as ideal_racing_line.json)
+# Versions are compared naturally ("v10" > "v9", "2025-02" > "2025-01");
+# requests without a track_version get the latest one.
+
+TRACKS_DIR = 'tracks'
+TRACK_CACHE_SIZE = 4        # Most registry tracks kept loaded (LRU beyond that)
+TRACK_SCAN_S = 10           # Directory listings are reused for this long
+
+def version_key(version):
+    """Natural sort key for version names."""
+    return [(0, int(part), '') if part.isdigit() else (1, 0, part)
+            for part in re.split(r'(\d+)', version) if part]
+
+class TrackRegistry:
+    """
+    Racing lines keyed by (track_id, version). Geometry and indexes are
+    built on first use and kept in a bounded LRU, so adding a track file
+    needs no redeploy and loading one track never reloads another.
+    """
+
+    def __init__(self, max_loaded=TRACK_CACHE_SIZE):
+        self.max_loaded = max_loaded
+        self.loaded = OrderedDict()  # (track_id, version) -> TrackGeometry
+        self.scanned = {}            # track_id -> (time, {version: path})
+        self.lock = threading.Lock()
+
+    def versions(self, track_id):
+        """Available {version: path} for a track, .npz winning over .json."""
+        now = time.monotonic()
+        with self.lock:
+            scanned = self.scanned.get(track_id)
+            if scanned and now - scanned[0] < TRACK_SCAN_S:
+                return scanned[1]
+
+        found = {}
+        if os.path.basename(track_id) == track_id and not track_id.startswith('.'):
+            for directory in DATA_DIRS:
+                track_dir = os.path.join(directory, TRACKS_DIR, track_id)
+                if not os.path.isdir(track_dir):
+                    continue
+                for name in sorted(os.listdir(track_dir)):
+                    version, ext = os.path.splitext(name)
+                    if ext == '.npz' or (ext == '.json' and version not in found):
+                        found[version] = os.path.join(track_dir, name)
+        with self.lock:
+            self.scanned[track_id] = (now, found)
+        return found
+
+    def available(self):
+        """{track_id: [versions, oldest first]} across all data dirs."""
+        track_ids = set()
+        for directory in DATA_DIRS:
+            tracks_dir = os.path.join(directory, TRACKS_DIR)
+            if os.path.isdir(tracks_dir):
+                track_ids.update(name for name in os.listdir(tracks_dir)
+                                 if os.path.isdir(os.path.join(tracks_dir, name)))
+        return {track_id: sorted(self.versions(track_id), key=version_key)
+                for track_id in sorted(track_ids)}
 
-    for i, point in enumerate(RACING_LINE):
-        dist = haversine(lat, lon, point['lat'], point['lon'])
-        if dist < min_dist:
-            min_dist = dist
-            nearest_idx = i
-            nearest_point = point
+    def get(self, track_id, version=None):
+        """Geometry for a track version (latest if None). Raises LookupError if unknown."""
+        versions = self.versions(track_id)
+        if not versions:
+            raise LookupError(f'unknown track {track_id!r}')
+        if version is None:
+            version = max(versions, key=version_key)
+        elif version not in versions:
+            raise LookupError(f'unknown version {version!r} of track {track_id!r}')
 
-    return nearest_point, nearest_idx, min_dist * 1000  # Return distance in meters
+        key = (track_id, version)
+        with self.lock:
+            track = self.loaded.get(key)
+            if track is not None:
+                self.loaded.move_to_end(key)
+                return track
+
+        # Load outside the lock so other tracks keep serving meanwhile
+        track = self.load(versions[version])
+        track.key = key
+        with self.lock:
+            track = self.loaded.setdefault(key, track)
+            self.loaded.move_to_end(key)
+            while len(self.loaded) > self.max_loaded:
+                self.loaded.popitem(last=False)
+        print(f"Loaded track {track_id} {version}: {len(track)} points")
+        return track
+
+    def load(self, path):
+        if path.endswith('.npz'):
+            # Prefer the artifact for large lines, unless its source JSON has changed since the build
+            track_dir, name = os.path.split(path)
+            source = find_data_file(os.path.join(TRACKS_DIR, os.path.basename(track_dir),
+                                                 os.path.splitext(name)[0] + '.json'))
+            if prefer_artifact(source):
+                try:
+                    return load_racing_line_artifact(path, source)[0]
+                except ValueError as e:
+                    if source is None:
+                        raise
+                    print(f"Ignoring track artifact {path}: {e}")
+            path = source
+        with open(path, 'r') as f:
+            data = json.load(f)
+        validate_racing_line(data)
+        track = TrackGeometry.from_racing_line(data['racing_line'])
+        track.set_segments(data.get('segments', []))
+        return track
+
+    def loaded_keys(self):
+        with self.lock:
+            return [list(key) for key in self.loaded]
+
+REGISTRY = TrackRegistry()
+
+# ============== PREDICTION ==============
+PREDICT_LATENCY_MS = 150        # Expected delivery latency when the client sends none
+PREDICT_MAX_S = 1.5             # Never extrapolate further ahead than this
+PREDICT_MAX_DEVIATION_M = 10    # Only follow the line when at least this close to it
+
+def parse_timestamp(value):
+    """Epoch seconds from epoch seconds/milliseconds or an ISO 8601 string, else None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        if value <= 0:
+            return None
+        return value / 1000 if value > 1e11 else float(value)
+    if isinstance(value, str):
+        try:
+            stamp = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+        if stamp.tzinfo is None:
+            stamp = stamp.replace(tzinfo=timezone.utc)
+        return stamp.timestamp()
+    return None
+
+def prediction_horizon(sample_time, latency_ms=None):
+    """Seconds from the sample to when the overlay is shown, clamped to PREDICT_MAX_S."""
+    latency = PREDICT_LATENCY_MS if latency_ms is None else latency_ms
+    horizon = time.time() - sample_time + latency / 1000
+    return min(max(horizon, 0.0), PREDICT_MAX_S)
+
+def predict_pose(track, east, north, heading, speed, station_m, horizon_s):
+    """
+    Car pose horizon_s ahead, assuming it follows the racing line: advance
+    the station by speed * horizon, keep the lateral offset from the line,
+    and turn the heading by the change in line direction, so the curvature
+    ahead is taken from the line itself.
+    Returns (east, north, heading, station_m, distance_m).
+    """
+    distance = max(speed, 0) / 3.6 * horizon_s
+    e0, n0, ue0, un0 = track.at_station(station_m)
+    offset = (north - n0) * ue0 - (east - e0) * un0   # Metres left of the line
+
+    station = (station_m + distance) % track.lap_length
+    e1, n1, ue1, un1 = track.at_station(station)
+
+    # Change in line direction, in the projection's heading convention (see enu_to_pixel)
+    turn = math.degrees(math.atan2(-ue1, un1) - math.atan2(-ue0, un0))
+    turn = (turn + 180) % 360 - 180
+    return e1 - offset * un1, n1 + offset * ue1, heading + turn, station, distance
 
 # ============== CAMERA PROJECTION ==============
 # GoPro / Wide angle camera settings
@@ -168,21 +1118,127 @@ CAMERA_FOV_H = 118          # Horizontal FOV degrees
 CAMERA_FOV_V = 69           # Vertical FOV degrees
 LOOKAHEAD_M = 40            # How far ahead to project
 
-def gps_to_pixel(target_lat, target_lon, car_lat, car_lon, car_heading,
-                 cam_width=1280, cam_height=720):
+# Calibrated camera profiles, selected per request with "camera". Without one
+# the FOV settings above are used. Intrinsics are in pixels at the calibration
+# size and are scaled to the requested frame size.
+#   model 'fisheye': equidistant fisheye, dist = k1..k4 (as cv2.fisheye)
+#   model 'pinhole': Brown-Conrady radial, dist = k1, k2, k3 (tangential ignored)
+# Values are nominal; replace with cv2 calibration results for each unit.
+CAMERA_PROFILES = {
+    'gopro': {
+        'model': 'fisheye', 'size': (1920, 1080),
+        'fx': 935.0, 'fy': 935.0, 'cx': 960.0, 'cy': 540.0,
+        'dist': (0.05, -0.01, 0.0, 0.0),
+        'height_m': 0.8, 'pitch_deg': 0.0
+    },
+    'pi_gs': {  # Raspberry Pi Global Shutter camera (IMX296), 6 mm lens
+        'model': 'pinhole', 'size': (1456, 1088),
+        'fx': 1739.0, 'fy': 1739.0, 'cx': 728.0, 'cy': 544.0,
+        'dist': (-0.12, 0.05, 0.0),
+        'height_m': 0.8, 'pitch_deg': 5.0
+    }
+}
+CAMERA_LUT_SIZE = 1024      # Samples in each radial distortion table
+CAMERA_LUT_CACHE = 32       # (profile, width, height) tables kept
+
+def distorted_radius(model, dist, r):
+    """Distorted normalised image radius for undistorted radius r."""
+    if model == 'fisheye':
+        k1, k2, k3, k4 = (tuple(dist) + (0.0,) * 4)[:4]
+        theta = np.arctan(r)
+        t2 = theta * theta
+        return theta * (1 + t2 * (k1 + t2 * (k2 + t2 * (k3 + t2 * k4))))
+    k1, k2, k3 = (tuple(dist) + (0.0,) * 3)[:3]
+    r2 = r * r
+    return r * (1 + r2 * (k1 + r2 * (k2 + r2 * k3)))
+
+class CameraLUT:
     """
-    Project GPS point to screen pixel coordinates.
-    Returns (x, y) or None if not visible.
+    Projection for one camera profile at one frame size. Lens distortion is
+    tabulated once as a scale factor over squared undistorted radius, so
+    projecting a point is a divide, a table lookup and a multiply-add.
     """
-    # Calculate relative position in meters
-    dx = haversine(car_lat, car_lon, car_lat, target_lon) * 1000
-    if target_lon < car_lon:
-        dx = -dx
 
-    dy = haversine(car_lat, car_lon, target_lat, car_lon) * 1000
-    if target_lat < car_lat:
-        dy = -dy
+    def __init__(self, profile, cam_width, cam_height):
+        calib_width, calib_height = profile['size']
+        self.width, self.height = cam_width, cam_height
+        self.fx = profile['fx'] * cam_width / calib_width
+        self.fy = profile['fy'] * cam_height / calib_height
+        self.cx = profile['cx'] * cam_width / calib_width
+        self.cy = profile['cy'] * cam_height / calib_height
+        self.height_m = profile['height_m']
+        pitch = math.radians(profile.get('pitch_deg', 0))
+        self.cos_p, self.sin_p = math.cos(pitch), math.sin(pitch)
+
+        # Cover radii out to just past the farthest frame corner, stopping
+        # where the distortion polynomial stops increasing
+        corner = max(math.hypot((x - self.cx) / self.fx, (y - self.cy) / self.fy)
+                     for x in (0, cam_width) for y in (0, cam_height))
+        r = np.tan(np.radians(np.linspace(0, 89, 4096)))
+        rd = distorted_radius(profile['model'], profile['dist'], r)
+        rising = np.flatnonzero(np.diff(rd) <= 0)
+        last = rising[0] if len(rising) else len(r) - 1
+        beyond = np.flatnonzero(rd[:last + 1] >= corner * 1.02)
+        r_max = r[beyond[0]] if len(beyond) else r[last]
+
+        self.r2_max = float(r_max * r_max)
+        self.r2_step_inv = (CAMERA_LUT_SIZE - 1) / self.r2_max
+        r = np.sqrt(np.linspace(0, self.r2_max, CAMERA_LUT_SIZE)[1:])
+        self.scale = np.concatenate([[1.0], distorted_radius(profile['model'], profile['dist'], r) / r])
+        self.scale_step = np.append(np.diff(self.scale), 0.0)
 
+    def project(self, rel_x, rel_y):
+        """Pixels for car-frame ground offsets (metres right, ahead). Returns (px, py, visible)."""
+        # Camera frame: x right, y down, z forward, pitched down by pitch_deg
+        z = rel_y * self.cos_p + self.height_m * self.sin_p
+        y = self.height_m * self.cos_p - rel_y * self.sin_p
+        z_safe = np.where(z > 0, z, 1.0)
+        xn, yn = rel_x / z_safe, y / z_safe
+        r2 = xn * xn + yn * yn
+
+        # Linear interpolation on the uniform table
+        pos = np.minimum(r2 * self.r2_step_inv, CAMERA_LUT_SIZE - 1)
+        i = pos.astype(np.intp)
+        scale = self.scale[i] + (pos - i) * self.scale_step[i]
+
+        px = np.floor(self.cx + self.fx * xn * scale).astype(np.int64)
+        py = np.floor(self.cy + self.fy * yn * scale).astype(np.int64)
+        visible = ((z > 0) & (r2 <= self.r2_max) &
+                   (px >= 0) & (px < self.width) & (py >= 0) & (py < self.height))
+        return px, py, visible
+
+class CameraLUTCache:
+    """LRU of CameraLUT keyed on (profile, width, height)."""
+
+    def __init__(self, max_size=CAMERA_LUT_CACHE):
+        self.max_size = max_size
+        self.luts = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, camera, cam_width, cam_height):
+        profile = CAMERA_PROFILES.get(camera)
+        if profile is None:
+            raise LookupError(f'unknown camera {camera!r}')
+        key = (camera, int(cam_width), int(cam_height))
+        with self.lock:
+            lut = self.luts.get(key)
+            if lut is not None:
+                self.luts.move_to_end(key)
+                return lut
+        lut = CameraLUT(profile, key[1], key[2])
+        with self.lock:
+            self.luts[key] = lut
+            while len(self.luts) > self.max_size:
+                self.luts.popitem(last=False)
+        return lut
+
+CAMERA_LUTS = CameraLUTCache()
+
+def enu_to_pixel(dx, dy, car_heading, cam_width=1280, cam_height=720):
+    """
+    Project an east/north offset from the car (metres) to screen pixels.
+    Returns (x, y) or None if not visible.
+    """
     # Rotate by heading (car's direction)
     heading_rad = math.radians(car_heading)
     rel_x = dx * math.cos(heading_rad) + dy * math.sin(heading_rad)
@@ -209,18 +1265,83 @@ def gps_to_pixel(target_lat, target_lon, car_lat, car_lon, car_heading,
 
     return [px, py]
 
-def calculate_overlay(lat, lon, heading, speed, cam_width=1280, cam_height=720):
+def project_enu(dx, dy, car_heading, cam_width=1280, cam_height=720, camera=None):
     """
-    Calculate overlay points for the ideal racing line.
-    Returns list of pixel coordinates to draw.
+    Elementwise projection of east/north offsets from the car.
+    car_heading may be a scalar or an array broadcastable against dx/dy.
+    With a camera profile name, uses that profile's lookup table.
+    Returns (px, py, visible) arrays of the same shape as dx.
     """
-    if not RACING_LINE:
-        load_racing_line()
+    # Rotate by heading (car's direction)
+    heading_rad = np.radians(car_heading)
+    cos_h, sin_h = np.cos(heading_rad), np.sin(heading_rad)
+    rel_x = dx * cos_h + dy * sin_h
+    rel_y = -dx * sin_h + dy * cos_h
+
+    if camera is not None:
+        px, py, visible = CAMERA_LUTS.get(camera, cam_width, cam_height).project(rel_x, rel_y)
+        return px, py, visible & (rel_y > 0.5) & (rel_y <= LOOKAHEAD_M)
+
+    # Keep points in front of car, within range and inside horizontal FOV
+    angle_h = np.degrees(np.arctan2(rel_x, rel_y))
+    visible = (rel_y > 0.5) & (rel_y <= LOOKAHEAD_M) & (np.abs(angle_h) <= CAMERA_FOV_H / 2)
+    angle_v = np.degrees(np.arctan2(CAMERA_HEIGHT_M, rel_y))
+
+    # Convert angles to pixel coordinates (astype truncates like int())
+    px = (cam_width / 2 + (angle_h / (CAMERA_FOV_H / 2)) * (cam_width / 2)).astype(np.int64)
+    py = (cam_height / 2 + (angle_v / (CAMERA_FOV_V / 2)) * (cam_height / 2)).astype(np.int64)
+
+    # Clamp to frame bounds
+    px = np.clip(px, 0, cam_width - 1)
+    py = np.clip(py, 0, cam_height - 1)
+
+    return px, py, visible
+
+def enu_to_pixels(dx, dy, car_heading, cam_width=1280, cam_height=720, camera=None):
+    """
+    Vectorized enu_to_pixel over arrays of east/north offsets.
+    Returns an (N, 2) int array of the visible points, in input order.
+    """
+    px, py, visible = project_enu(dx, dy, car_heading, cam_width, cam_height, camera)
+    return np.stack([px[visible], py[visible]], axis=1)
+
+def gps_to_pixel(target_lat, target_lon, car_lat, car_lon, car_heading,
+                 cam_width=1280, cam_height=720):
+    """
+    Project GPS point to screen pixel coordinates.
+    Scalar reference for gps_to_pixels. Returns (x, y) or None if not visible.
+    """
+    dx, dy = geodetic_to_enu(target_lat, target_lon, car_lat, car_lon)
+    return enu_to_pixel(float(dx), float(dy), car_heading, cam_width, cam_height)
 
-    # Find nearest point on racing line
-    nearest_point, nearest_idx, deviation_m = find_nearest_point(lat, lon)
+def gps_to_pixels(target_lats, target_lons, car_lat, car_lon, car_heading,
+                  cam_width=1280, cam_height=720, camera=None):
+    """
+    Vectorized gps_to_pixel over arrays of GPS points.
+    Returns an (N, 2) int array of the visible points, in input order.
+    """
+    dx, dy = geodetic_to_enu(np.asarray(target_lats, dtype=np.float64),
+                             np.asarray(target_lons, dtype=np.float64),
+                             car_lat, car_lon)
+    return enu_to_pixels(dx, dy, car_heading, cam_width, cam_height, camera)
 
-    if nearest_point is None:
+def calculate_overlay(lat, lon, heading, speed, cam_width=1280, cam_height=720,
+                      session_id=None, track_id=None, track_version=None, camera=None,
+                      timestamp=None, latency_ms=None):
+    """
+    Calculate overlay points for the ideal racing line.
+    Returns list of pixel coordinates to draw. With a sample timestamp the
+    points are for the pose predicted when the overlay is shown.
+    """
+    track = get_track(track_id, track_version)
+    if camera is not None:
+        CAMERA_LUTS.get(camera, cam_width, cam_height)  # Unknown cameras fail before caching
+    sample_time = None
+    if timestamp is not None:
+        sample_time = parse_timestamp(timestamp)
+        if sample_time is None:
+            raise ValueError(f'invalid timestamp {timestamp!r}')
+    if track is None:
         return {
             'overlay_points': [],
             'target_speed': 0,
@@ -230,90 +1351,366 @@ def calculate_overlay(lat, lon, heading, speed, cam_width=1280, cam_height=720):
             'on_track': False
         }
 
-    # Get next N points on racing line (lookahead)
-    overlay_points = []
-    num_points = min(60, len(RACING_LINE) - nearest_idx)
+    # Serve repeat poses from the cache without recomputing (predicted
+    # overlays depend on the clock, so they are not cached)
+    car_e, car_n = track.to_enu(lat, lon)
+    cache_key = RESPONSE_CACHE.key(track.key, car_e, car_n, heading, speed,
+                                   cam_width, cam_height, camera)
+    cached = RESPONSE_CACHE.get(cache_key) if sample_time is None else None
+    if cached is not None:
+        nearest_idx, result = cached
+        if session_id is not None:
+            SESSIONS.put((track.key, session_id), nearest_idx)
+        return dict(result)
 
-    for i in range(nearest_idx, nearest_idx + num_points):
-        idx = i % len(RACING_LINE)  # Wrap around for closed track
-        point = RACING_LINE[idx]
+    # Find nearest point on racing line, in local metres
+    start = time.perf_counter()
+    nearest_idx, vertex_dist = track.match(car_e, car_n, session_id)
+    deviation_m, station_m = track.project(car_e, car_n, nearest_idx, vertex_dist)
+    matched = time.perf_counter()
+    METRICS.observe('nearest', matched - start)
 
-        pixel = gps_to_pixel(
-            point['lat'], point['lon'],
-            lat, lon, heading,
-            cam_width, cam_height
-        )
+    # Draw from where the car will be when the overlay is shown
+    view_e, view_n, view_heading, view_idx = car_e, car_n, heading, nearest_idx
+    horizon_s = distance_m = 0.0
+    if sample_time is not None and deviation_m < PREDICT_MAX_DEVIATION_M:
+        horizon_s = prediction_horizon(sample_time, latency_ms)
+        view_e, view_n, view_heading, view_station, distance_m = predict_pose(
+            track, car_e, car_n, heading, speed, station_m, horizon_s)
+        view_idx = int(round(view_station / track.spacing)) % len(track)
+
+    # Racing line points within LOOKAHEAD_M by station, relative to the car
+    window = track.lookahead(view_idx, LOOKAHEAD_M)
+
+    pixels = enu_to_pixels(
+        track.east[window] - view_e,
+        track.north[window] - view_n,
+        view_heading, cam_width, cam_height, camera
+    )
+    result = build_overlay_result(track, nearest_idx, deviation_m, station_m,
+                                  pixels.tolist(), speed)
+    METRICS.observe('projection', time.perf_counter() - matched)
+    if sample_time is None:
+        RESPONSE_CACHE.put(cache_key, nearest_idx, result)
+    else:
+        result['predicted_ms'] = round(horizon_s * 1000)
+        result['predicted_m'] = round(distance_m, 2)
+
+    return dict(result)
 
-        if pixel:
-            overlay_points.append(pixel)
+def build_overlay_result(track, nearest_idx, deviation_m, station_m, overlay_points, speed):
+    """Assemble the response for a matched racing line point."""
+    nearest_point = track.point(nearest_idx)
 
-    # Get current segment info
-    segment = SEGMENTS[nearest_point['segment_id']] if SEGMENTS else {}
+    # Get current segment info; its target speed wins so the response
+    # never mixes two segments when start_m and point segment_ids disagree
+    segment = track.segment_at(station_m, nearest_idx)
+    target_speed = segment.get('target_speed_kmh',
+                               segment.get('target_speed', nearest_point.get('target_speed', 0)))
 
     return {
         'overlay_points': overlay_points,
-        'target_speed': nearest_point.get('target_speed', 0),
+        'target_speed': target_speed,
         'deviation_m': round(deviation_m, 2),
-        'segment': nearest_point.get('segment_name', 'N/A'),
-        'efficiency': segment.get('efficiency', 0),
+        'segment': segment.get('name', nearest_point.get('segment_name', 'N/A')),
+        'segment_id': segment.get('id', nearest_point.get('segment_id', -1)),
+        'efficiency': segment.get('efficiency', segment.get('efficiency_km_kwh', 0)),
         'on_track': deviation_m < 10,  # Within 10m of racing line
-        'speed_diff': round(nearest_point.get('target_speed', 0) - speed, 1)
+        'speed_diff': round(target_speed - speed, 1)
     }
 
-# ============== VERCEL HANDLER ==============
-class handler(BaseHTTPRequestHandler):
-    def do_POST(self):
-        content_length = int(self.headers['Content-Length'])
-        post_data = self.rfile.read(content_length)
+# ============== BATCH MODE ==============
+BATCH_CHUNK = 512           # Samples computed (and streamed) per pass
+BATCH_MAX_CELLS = 1 << 20   # Cap on the sample x point distance matrix size
 
+def sample_arrays(samples):
+    """
+    (latitude, longitude, heading, speed) float arrays for batch samples,
+    missing fields as 0. Raises ValueError naming the first sample with a
+    null, non-numeric or non-finite value.
+    """
+    columns = []
+    for key in ('latitude', 'longitude', 'heading', 'speed'):
+        values = [s.get(key, 0) for s in samples]
         try:
-            data = json.loads(post_data.decode('utf-8'))
+            column = np.array(values, dtype=np.float64)
+            bad = np.flatnonzero(~np.isfinite(column))
+            bad = int(bad[0]) if len(bad) else None
+        except (TypeError, ValueError):
+            bad = next(k for k, v in enumerate(values) if not is_number(v))
+        if bad is not None:
+            raise ValueError(f'samples[{bad}].{key} must be a finite number')
+        columns.append(column)
+    return columns
 
-            lat = data.get('latitude', 0)
-            lon = data.get('longitude', 0)
-            heading = data.get('heading', 0)
-            speed = data.get('speed', 0)
-            cam_width = data.get('camera_width', 1280)
-            cam_height = data.get('camera_height', 720)
+def is_number(value):
+    try:
+        return math.isfinite(float(value))
+    except (TypeError, ValueError):
+        return False
 
-            result = calculate_overlay(lat, lon, heading, speed, cam_width, cam_height)
+def iter_overlay_batch(samples, cam_width=1280, cam_height=720, chunk=BATCH_CHUNK,
+                       track_id=None, track_version=None, camera=None, arrays=None):
+    """
+    Overlay results for a list of {latitude, longitude, heading, speed}
+    samples, yielded as lists of up to `chunk` results so large batches can
+    be streamed. Each chunk is matched and projected in one array pass;
+    the per-request cache and sessions are bypassed. Pass `arrays` from
+    sample_arrays() to validate before the first result is requested.
+    """
+    lat_all, lon_all, heading_all, speed_all = arrays if arrays is not None else sample_arrays(samples)
+    track = get_track(track_id, track_version)
+    if track is None:
+        for start in range(0, len(samples), chunk):
+            yield [calculate_overlay(float(lat_all[k]), float(lon_all[k]),
+                                     float(heading_all[k]), float(speed_all[k]))
+                   for k in range(start, min(start + chunk, len(samples)))]
+        return
 
-            self.send_response(200)
-            self.send_header('Content-Type', 'application/json')
-            self.send_header('Access-Control-Allow-Origin', '*')
-            self.end_headers()
-            self.wfile.write(json.dumps(result).encode())
+    n = len(track)
+    width = min(int(LOOKAHEAD_M / (track.lap_length / n)) + 2, n)
+    offsets = np.arange(width)
 
-        except Exception as e:
-            self.send_response(400)
-            self.send_header('Content-Type', 'application/json')
-            self.end_headers()
-            self.wfile.write(json.dumps({'error': str(e)}).encode())
+    for start in range(0, len(samples), chunk):
+        part = samples[start:start + chunk]
+        lat = lat_all[start:start + chunk]
+        lon = lon_all[start:start + chunk]
+        heading = heading_all[start:start + chunk]
+        speed = speed_all[start:start + chunk].tolist()
 
-    def do_GET(self):
-        """Health check and info."""
-        load_racing_line()
+        car_e, car_n = geodetic_to_enu(lat, lon, track.lat0, track.lon0)
+        nearest, deviation, station = track.match_batch(car_e, car_n)
 
-        self.send_response(200)
-        self.send_header('Content-Type', 'application/json')
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.end_headers()
+        # Lookahead windows as a (samples, width) index matrix, masked by station
+        idx = (nearest[:, None] + offsets) % n
+        ahead = (track.station[idx] - track.station[nearest][:, None]) % track.lap_length
+        px, py, visible = project_enu(
+            track.east[idx] - car_e[:, None],
+            track.north[idx] - car_n[:, None],
+            heading[:, None], cam_width, cam_height, camera
+        )
+        visible &= ahead <= LOOKAHEAD_M
+        pixels = np.stack([px, py], axis=2)
 
-        info = {
-            'service': 'PSU Racing Line Overlay API',
-            'racing_line_points': len(RACING_LINE) if RACING_LINE else 0,
-            'segments': len(SEGMENTS) if SEGMENTS else 0,
-            'usage': 'POST with {latitude, longitude, heading, speed, camera_width, camera_height}'
-        }
-        self.wfile.write(json.dumps(info).encode())
+        yield [
+            build_overlay_result(track, int(nearest[k]), float(deviation[k]), float(station[k]),
+                                 pixels[k][visible[k]].tolist(), speed[k])
+            for k in range(len(part))
+        ]
+
+def calculate_overlay_batch(samples, cam_width=1280, cam_height=720,
+                            track_id=None, track_version=None, camera=None):
+    """Overlay results for a list of samples, in order."""
+    results = []
+    for part in iter_overlay_batch(samples, cam_width, cam_height, track_id=track_id,
+                                   track_version=track_version, camera=camera):
+        results.extend(part)
+    return results
+
+# ============== BINARY FORMAT ==============
+BINARY_CONTENT_TYPE = 'application/octet-stream'
+
+# Header: magic, version, flags, seq, base_seq, point count,
+#         target_speed, deviation_m, speed_diff, segment_id
+BINARY_HEADER = struct.Struct('<2sBBHHHfffh')
+BINARY_MAGIC = b'RL'
+BINARY_VERSION = 1
+FLAG_ON_TRACK = 0x01
+FLAG_DELTA = 0x02           # Points are int8 deltas against response base_seq
+
+def encode_overlay_binary(result, session_key=None, delta_base=None):
+    """
+    Pack an overlay result as a little-endian binary frame.
+
+    Points follow the header as int16 (x, y) pairs. When the client names
+    the sequence number of the last frame it decoded for its session
+    (delta_base) and every point moved by less than 128 px, points are sent
+    instead as int8 (dx, dy) offsets from the base frame's point at the same
+    position (or its last point, for extra points). session_key is the
+    (track key, session_id) the matcher uses, so both share one Session.
+    """
+    points = np.asarray(result['overlay_points'], dtype=np.int16).reshape(-1, 2)
+    flags = FLAG_ON_TRACK if result.get('on_track') else 0
+    seq, base_seq, payload = 0, 0, points.astype('<i2').tobytes()
+
+    if session_key is not None:
+        seq, prev_seq, prev_points = SESSIONS.swap_points(session_key, points)
+        if (delta_base is not None and delta_base == prev_seq
+                and prev_points is not None and len(prev_points) and len(points)):
+            base = prev_points[np.minimum(np.arange(len(points)), len(prev_points) - 1)]
+            delta = points.astype(np.int32) - base
+            if np.abs(delta).max() <= 127:
+                flags |= FLAG_DELTA
+                base_seq = prev_seq
+                payload = delta.astype(np.int8).tobytes()
+
+    header = BINARY_HEADER.pack(
+        BINARY_MAGIC, BINARY_VERSION, flags, seq, base_seq, len(points),
+        result.get('target_speed', 0), result.get('deviation_m', 0),
+        result.get('speed_diff', 0), result.get('segment_id', -1)
+    )
+    return header + payload
+
+# ============== REQUEST PROCESSING ==============
+# Transport-independent request handling, shared by the Vercel handler below
+# and the standalone trackside server (scripts/trackside_server.py).
+# Each returns (status, headers, chunks) where chunks is an iterable of bytes.
+
+CORS_HEADERS = [('Access-Control-Allow-Origin', '*')]
+PREFLIGHT_HEADERS = CORS_HEADERS + [
+    ('Access-Control-Allow-Methods', 'GET, POST, OPTIONS'),
+    ('Access-Control-Allow-Headers', 'Content-Type')
+]
+
+def process_post(raw, accept=None):
+    """Handle a POST body for /api/racing_line."""
+    start = time.perf_counter()
+    accept = accept or ''
+    METRICS.incr('requests')
+
+    try:
+        data = json.loads(raw.decode('utf-8'))
+        METRICS.observe('parse', time.perf_counter() - start)
+
+        # Batch mode: a list of samples, or {"samples": [...], camera size}
+        if isinstance(data, list) or 'samples' in data:
+            return process_batch(data, accept)
+
+        lat = data.get('latitude', 0)
+        lon = data.get('longitude', 0)
+        heading = data.get('heading', 0)
+        speed = data.get('speed', 0)
+        cam_width = data.get('camera_width', 1280)
+        cam_height = data.get('camera_height', 720)
+        session_id = data.get('session_id')
+
+        result = calculate_overlay(lat, lon, heading, speed, cam_width, cam_height,
+                                   session_id, data.get('track'), data.get('track_version'),
+                                   data.get('camera'), data.get('timestamp'),
+                                   data.get('latency_ms'))
+        if not result.get('on_track'):
+            METRICS.incr('off_track')
+
+        # JSON unless the client asks for the binary encoding
+        serialize_start = time.perf_counter()
+        if BINARY_CONTENT_TYPE in accept:
+            session_key = None
+            if session_id is not None:
+                track = get_track(data.get('track'), data.get('track_version'))
+                session_key = (track.key if track is not None else None, session_id)
+            body = encode_overlay_binary(result, session_key, data.get('delta_base'))
+            content_type = BINARY_CONTENT_TYPE
+        else:
+            body = json.dumps(result).encode()
+            content_type = 'application/json'
+        METRICS.observe('serialize', time.perf_counter() - serialize_start)
+
+        headers = [('Content-Type', content_type), ('Vary', 'Accept')] + CORS_HEADERS
+        return 200, headers, [body]
+
+    except Exception as e:
+        METRICS.incr('errors')
+        return 400, [('Content-Type', 'application/json')], [json.dumps({'error': str(e)}).encode()]
+
+def process_batch(data, accept):
+    """
+    Batch results, generated chunk by chunk as they are computed: a JSON
+    array by default, or one result per line with Accept: application/x-ndjson.
+    """
+    if isinstance(data, list):
+        samples, options = data, {}
+    else:
+        samples, options = data['samples'], data
+    cam_width = int(options.get('camera_width', 1280))
+    cam_height = int(options.get('camera_height', 720))
+    track_id = options.get('track')
+    track_version = options.get('track_version')
+    camera = options.get('camera')
+    ndjson = 'application/x-ndjson' in accept
+
+    # Validate up front so errors still get a 400 before streaming starts
+    if not isinstance(samples, list) or not all(isinstance(s, dict) for s in samples):
+        raise ValueError('samples must be a list of objects')
+    arrays = sample_arrays(samples)
+    get_track(track_id, track_version)
+    if camera is not None:
+        CAMERA_LUTS.get(camera, cam_width, cam_height)
+    METRICS.incr('batch_requests')
+    METRICS.incr('batch_samples', len(samples))
+
+    def chunks():
+        first = True
+        if not ndjson:
+            yield b'['
+        for part in iter_overlay_batch(samples, cam_width, cam_height, track_id=track_id,
+                                       track_version=track_version, camera=camera,
+                                       arrays=arrays):
+            if ndjson:
+                body = ''.join(json.dumps(result) + '\n' for result in part)
+            else:
+                body = ','.join(json.dumps(result) for result in part)
+                if part and not first:
+                    body = ',' + body
+                first = first and not part
+            yield body.encode()
+        if not ndjson:
+            yield b']'
+
+    content_type = 'application/x-ndjson' if ndjson else 'application/json'
+    return 200, [('Content-Type', content_type)] + CORS_HEADERS, chunks()
+
+def process_get(path):
+    """Health check and info, or metrics under /metrics (?format=json)."""
+    url = urlparse(path)
+    if url.path.rstrip('/').endswith('/metrics'):
+        if parse_qs(url.query).get('format', ['prometheus'])[0] == 'json':
+            body = json.dumps(METRICS.to_dict()).encode()
+            content_type = 'application/json'
+        else:
+            body = METRICS.to_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4'
+        return 200, [('Content-Type', content_type)] + CORS_HEADERS, [body]
+
+    track = get_track()
+    info = {
+        'service': 'PSU Racing Line Overlay API',
+        'racing_line_points': track.source_count if track else 0,
+        'resampled_points': len(track) if track else 0,
+        'segments': len(SEGMENTS) if SEGMENTS else 0,
+        'tracks': REGISTRY.available(),
+        'tracks_loaded': REGISTRY.loaded_keys(),
+        'cameras': sorted(CAMERA_PROFILES),
+        'cache': RESPONSE_CACHE.stats(),
+        'usage': 'POST with {latitude, longitude, heading, speed, camera_width, camera_height, track}',
+        'batch_usage': 'POST a list of samples or {samples, camera_width, camera_height}'
+    }
+    return 200, [('Content-Type', 'application/json')] + CORS_HEADERS, [json.dumps(info).encode()]
+
+# ============== VERCEL HANDLER ==============
+class handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        start = time.perf_counter()
+        content_length = int(self.headers['Content-Length'])
+        status, headers, chunks = process_post(self.rfile.read(content_length),
+                                               self.headers.get('Accept'))
+        self.send(status, headers, chunks)
+        if status == 200:
+            METRICS.observe('total', time.perf_counter() - start)
+
+    def do_GET(self):
+        """Health check and info, or metrics under /metrics."""
+        self.send(*process_get(self.path))
 
     def do_OPTIONS(self):
         """Handle CORS preflight."""
-        self.send_response(200)
-        self.send_header('Access-Control-Allow-Origin', '*')
-        self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type')
-        self.end_headers()
+        self.send(200, PREFLIGHT_HEADERS, [])
 
-# Initialize on import
-load_racing_line()
+    def send(self, status, headers, chunks):
+        """Write a response, flushing after each body chunk."""
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(chunk)
+            self.wfile.flush()
@@ -5,18 +5,28 @@ Captures USB camera frames with GPS timestamps for perfect sync with telemetry.
 
 Run on Raspberry Pi:
     python3 gps_sync_streamer.py
+    python3 gps_sync_streamer.py --record   # also record the run to RECORD_DIR
+    python3 gps_sync_streamer.py --gps-baud 115200   # 10-25 Hz receivers
+    python3 gps_sync_streamer.py --mqtt-broker localhost --mqtt-port 1883 --no-tls
+    python3 gps_sync_streamer.py --bench-nmea [capture.nmea]   # parser throughput
 
 Requirements:
     pip3 install opencv-python paho-mqtt pyserial flask
 """
 
+import argparse
+import bisect
 import cv2
 import json
+import math
+import numpy as np
+import queue
+import struct
 import time
 import threading
 import serial
 from datetime import datetime, timezone
-from flask import Flask, Response, send_from_directory
+from flask import Flask, Response, request, send_from_directory
 import paho.mqtt.client as mqtt
 import os
 
@@ -27,10 +37,22 @@ CAMERA_WIDTH = 1280
 CAMERA_HEIGHT = 720
 CAMERA_FPS = 30
 JPEG_QUALITY = 80
+FRAME_BUFFERS = 3  # Initial capture buffers; more are added if stream variants hold them
+FRAME_RING_MB = 256  # Memory for recent raw frames (~3 s of 1280x720)
+FRAME_RING_TOLERANCE_S = 0.5  # /frame?t= misses by more than this -> 404
 
 # GPS settings
 GPS_PORT = "/dev/serial0"  # GPIO UART
-GPS_BAUD = 9600
+GPS_BAUD = 9600  # 115200 for 10-25 Hz receivers (--gps-baud)
+GPS_HISTORY_SIZE = 512  # Fixes kept for interpolation (~25 s at 20 Hz)
+GPS_DEAD_RECKON_S = 1.0  # Extrapolate past the newest fix at most this far
+
+# Recording settings (--record)
+RECORD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings')
+RECORD_JPEG_QUALITY = 85
+RECORD_QUEUE_FRAMES = 30  # Frames waiting for the writer (~80 MB at 720p); more are dropped
+RECORD_SEGMENT_FRAMES = 900  # New segment file every 30 s at 30 fps
+RECORD_FLUSH_FRAMES = 30  # Flush video and index to disk this often
 
 # MQTT settings
 MQTT_BROKER = "8fac0c92ea0a49b8b56f39536ba2fd78.s1.eu.hivemq.cloud"
@@ -39,6 +61,15 @@ MQTT_USER = "ShellJM"
 MQTT_PASS = "psuEcoteam1st"
 MQTT_TOPIC_VIDEO = "car/video"
 MQTT_TOPIC_GPS = "car/pi_gps"
+MQTT_TOPIC_GPS_BACKLOG = "car/pi_gps/backlog"  # Spooled samples sent after a reconnect
+MQTT_PUBLISH_HZ = 2  # Live GPS samples per second
+MQTT_RECONNECT_MAX_S = 30
+MQTT_SPOOL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'spool')
+MQTT_SPOOL_MB = 20  # ~10 h of samples; oldest dropped beyond this
+MQTT_SPOOL_SEGMENT_SAMPLES = 600
+MQTT_DRAIN_BATCH = 50  # Samples per backlog message
+MQTT_DRAIN_HZ = 4  # Backlog messages per second at most
+MQTT_DRAIN_ACK_TIMEOUT_S = 10  # Resend a batch not acknowledged by then
 
 # HTTP Stream settings
 HTTP_PORT = 8001
@@ -49,6 +80,106 @@ DASHBOARD_DIR = os.path.join(os.path.dirname(__file__), '..', 'app')
 # DASHBOARD_DIR = "/home/pi/dashboard"
 
 # ============== GLOBAL STATE ==============
+class GPSHistory:
+    """
+    Bounded, time-ordered history of RMC fixes in one preallocated array,
+    for position, speed and heading at any time.monotonic() instant.
+
+    Sentences reach us some time after their GPS epoch, with jitter. The
+    smallest (arrival - GPS time) over the history is taken as the clock
+    offset, so lookups are by GPS time and not by when a sentence
+    happened to be read.
+    """
+
+    MONO, GPS_TIME, LAT, LON, SPEED, HEADING = range(6)
+
+    def __init__(self, capacity=GPS_HISTORY_SIZE):
+        self.capacity = capacity
+        self.fixes = np.zeros((capacity, 6))
+        self.start = 0
+        self.count = 0
+        self.offset = None  # time.monotonic() - GPS time
+        self.lock = threading.Lock()
+
+    def add(self, mono, gps_time, latitude, longitude, speed_kmh, heading):
+        with self.lock:
+            if self.count:
+                newest = self.fixes[(self.start + self.count - 1) % self.capacity]
+                if gps_time <= newest[self.GPS_TIME]:
+                    if gps_time > newest[self.GPS_TIME] - 60:
+                        return  # Repeat of an epoch we have
+                    self.start = self.count = 0  # Receiver time jumped back; start over
+            slot = (self.start + self.count) % self.capacity
+            if self.count == self.capacity:
+                self.start = (self.start + 1) % self.capacity
+            else:
+                self.count += 1
+            self.fixes[slot] = (mono, gps_time, latitude, longitude, speed_kmh, heading)
+            # Until full, the valid rows are exactly 0..count-1
+            rows = self.fixes[:self.count]
+            self.offset = float((rows[:, self.MONO] - rows[:, self.GPS_TIME]).min())
+
+    def gps_time(self, mono):
+        """GPS time at a monotonic instant, or None before the first fix."""
+        with self.lock:
+            return None if self.offset is None else mono - self.offset
+
+    def at(self, mono):
+        """
+        (gps_time, latitude, longitude, speed_kmh, heading) at a monotonic
+        instant: interpolated between the fixes around it, or dead-reckoned
+        from the newest fix at its speed and heading for up to
+        GPS_DEAD_RECKON_S. None outside that range.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            t = mono - self.offset
+            fixes, start, capacity = self.fixes, self.start, self.capacity
+            lo, hi = 0, self.count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if fixes[(start + mid) % capacity, self.GPS_TIME] < t:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo == self.count:
+                newest = fixes[(start + self.count - 1) % capacity].copy()
+            elif lo == 0:
+                first = fixes[start]
+                if first[self.GPS_TIME] - t > 1e-3:
+                    return None
+                return (t,) + tuple(first[self.LAT:].tolist())
+            else:
+                a = fixes[(start + lo - 1) % capacity]
+                b = fixes[(start + lo) % capacity]
+                w = (t - a[self.GPS_TIME]) / (b[self.GPS_TIME] - a[self.GPS_TIME])
+                turn = (b[self.HEADING] - a[self.HEADING] + 180) % 360 - 180
+                return (t,
+                        a[self.LAT] + w * (b[self.LAT] - a[self.LAT]),
+                        a[self.LON] + w * (b[self.LON] - a[self.LON]),
+                        a[self.SPEED] + w * (b[self.SPEED] - a[self.SPEED]),
+                        (a[self.HEADING] + w * turn) % 360)
+
+        # Past the newest fix: straight line at its speed and course
+        ahead = t - newest[self.GPS_TIME]
+        if ahead > GPS_DEAD_RECKON_S:
+            return None
+        latitude, longitude, speed_kmh, heading = newest[self.LAT:].tolist()
+        distance = speed_kmh / 3.6 * ahead
+        course = math.radians(heading)  # Clockwise from true north
+        latitude += distance * math.cos(course) / 111320
+        longitude += distance * math.sin(course) / (111320 * math.cos(math.radians(latitude)))
+        return (t, latitude, longitude, speed_kmh, heading)
+
+    def status(self):
+        with self.lock:
+            if self.count == 0:
+                return {"fixes": 0}
+            newest = self.fixes[(self.start + self.count - 1) % self.capacity]
+            return {"fixes": self.count,
+                    "arrival_jitter_s": round(float(newest[self.MONO] - newest[self.GPS_TIME] - self.offset), 3)}
+
 class GPSState:
     def __init__(self):
         self.latitude = 0.0
@@ -59,13 +190,16 @@ class GPSState:
         self.altitude = 0.0
         self.satellites = 0
         self.fix_quality = 0
-        self.timestamp = None  # GPS timestamp (UTC)
+        self.gps_time = None  # GPS time of the latest fix (UTC epoch seconds)
+        self.fix_monotonic = 0.0  # time.monotonic() when that fix arrived
         self.last_update = 0
+        self.history = GPSHistory()
         self.lock = threading.Lock()
 
-    def to_dict(self):
+    def to_dict(self, at=None):
+        """Latest fix; with a monotonic time `at`, position, speed and heading as of then."""
         with self.lock:
-            return {
+            data = {
                 "latitude": self.latitude,
                 "longitude": self.longitude,
                 "speed_kmh": self.speed_kmh,
@@ -73,105 +207,464 @@ class GPSState:
                 "altitude": self.altitude,
                 "satellites": self.satellites,
                 "fix_quality": self.fix_quality,
-                "gps_timestamp": self.timestamp.isoformat() if self.timestamp else None,
+                "gps_timestamp": (datetime.fromtimestamp(self.gps_time, timezone.utc).isoformat()
+                                  if self.gps_time is not None else None),
                 "pi_timestamp": datetime.now(timezone.utc).isoformat()
             }
+        fix = self.history.at(at) if at is not None else None
+        if fix is not None:
+            gps_time, *values = fix
+            data.update(zip(("latitude", "longitude", "speed_kmh", "heading"), values))
+            data["gps_timestamp"] = datetime.fromtimestamp(gps_time, timezone.utc).isoformat()
+        return data
+
+    def fix_at(self, mono):
+        """
+        (gps_time, latitude, longitude, speed_kmh, heading) at a
+        time.monotonic() instant, interpolated from the history where
+        possible, otherwise the latest values.
+        """
+        fix = self.history.at(mono)
+        if fix is not None:
+            return fix
+        with self.lock:
+            latest = (self.latitude, self.longitude, self.speed_kmh, self.heading)
+        return (self.gps_time_at(mono),) + latest
+
+    def time_source(self):
+        """'gps' once any fix has set the clock, else 'system' (see gps_time_at)."""
+        if self.history.offset is not None:
+            return "gps"
+        with self.lock:
+            return "gps" if self.gps_time is not None else "system"
+
+    def gps_time_at(self, mono):
+        """
+        GPS time (epoch seconds) at a time.monotonic() instant, from the
+        history's clock offset or carried forward from the latest fix.
+        Falls back to system time without one.
+        """
+        gps_time = self.history.gps_time(mono)
+        if gps_time is not None:
+            return gps_time
+        with self.lock:
+            if self.gps_time is not None:
+                return self.gps_time + (mono - self.fix_monotonic)
+        return time.time() - (time.monotonic() - mono)
+
+class FrameExchange:
+    """
+    Zero-copy handoff of captured frames to consumers.
+
+    The camera reads into one of FRAME_BUFFERS preallocated buffers and
+    publishes it with a sequence number; consumers block on a condition
+    variable until a newer frame exists and hold the buffer while they use
+    it. A buffer that is the latest or still held is never captured into;
+    when every buffer is, another is added so the camera never waits on
+    slow consumers (the pool tops out at stream variants + 2).
+    """
+
+    def __init__(self, count=FRAME_BUFFERS):
+        self.buffers = [None] * count
+        self.holders = [0] * count
+        self.latest = -1
+        self.seq = 0
+        self.cond = threading.Condition()
+
+    def writable(self):
+        """Index of a buffer the camera may overwrite, adding one if all are held."""
+        with self.cond:
+            for i, holders in enumerate(self.holders):
+                if i != self.latest and holders == 0:
+                    return i
+            self.buffers.append(None)
+            self.holders.append(0)
+            print(f"[CAM] All frame buffers in use; grew to {len(self.buffers)}")
+            return len(self.buffers) - 1
+
+    def publish(self, index, frame):
+        """Make a freshly captured buffer the latest frame and wake consumers."""
+        with self.cond:
+            self.buffers[index] = frame
+            self.latest = index
+            self.seq += 1
+            self.cond.notify_all()
+
+    def acquire(self, after_seq, timeout=1.0):
+        """
+        Block until a frame newer than after_seq exists.
+        Returns (seq, index, frame), or None on timeout. Call release(index).
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq != after_seq, timeout):
+                return None
+            self.holders[self.latest] += 1
+            return self.seq, self.latest, self.buffers[self.latest]
+
+    def release(self, index):
+        with self.cond:
+            self.holders[index] -= 1
+            self.cond.notify_all()
+
+class FrameRing:
+    """
+    Fixed-size ring of recent frames in preallocated memory, each tagged
+    with capture monotonic time, frame number and the GPS fix (time,
+    position, speed, heading) interpolated to the capture instant.
+
+    Slots are allocated once, from the first frame's shape, to fit in
+    FRAME_RING_MB. The slot being written is taken out of the searchable
+    window first, so readers copying a frame under the lock never see a
+    half-written one.
+
+    Lookups binary-search the GPS times, so they must never decrease. The
+    ring is cleared when the time source changes (system clock -> GPS)
+    or the tag jumps back by more than FRAME_RING_TOLERANCE_S; frames
+    tagged slightly earlier than the newest (the clock offset settling)
+    are skipped.
+    """
+
+    def __init__(self, max_bytes=FRAME_RING_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.frames = None
+        self.capacity = 0
+        self.monotonic = None
+        self.fixes = None
+        self.gps_time = None
+        self.frame_no = None
+        self.start = 0   # Slot of the oldest frame
+        self.count = 0   # Frames in the searchable window
+        self.source = None  # Time source of the buffered tags
+        self.resets = 0
+        self.skipped = 0
+        self.lock = threading.Lock()
+
+    def allocate(self, frame):
+        self.capacity = max(int(self.max_bytes // frame.nbytes), 2)
+        self.frames = np.zeros((self.capacity,) + frame.shape, dtype=frame.dtype)
+        self.monotonic = np.zeros(self.capacity)
+        self.fixes = np.zeros((self.capacity, 5))  # gps_time, lat, lon, speed_kmh, heading
+        self.gps_time = self.fixes[:, 0]
+        self.frame_no = np.zeros(self.capacity, dtype=np.int64)
+        print(f"[CAM] Frame ring: {self.capacity} frames "
+              f"({self.frames.nbytes / 1024 / 1024:.0f} MB)")
+
+    def add(self, frame, mono, fix, frame_no, source="gps"):
+        """Copy a captured frame into the next slot, overwriting the oldest."""
+        if self.frames is None:
+            self.allocate(frame)
+        if frame.shape != self.frames.shape[1:]:
+            return
+        with self.lock:
+            if self.count:
+                newest = self.gps_time[(self.start + self.count - 1) % self.capacity]
+                if source != self.source or newest - fix[0] > FRAME_RING_TOLERANCE_S:
+                    print(f"[CAM] Frame ring cleared: time source {self.source} -> {source}, "
+                          f"step {fix[0] - newest:+.3f} s")
+                    self.start = self.count = 0
+                    self.resets += 1
+                elif fix[0] < newest:
+                    self.skipped += 1
+                    return
+            self.source = source
+            slot = (self.start + self.count) % self.capacity
+            if self.count == self.capacity:
+                self.start = (self.start + 1) % self.capacity
+                self.count -= 1
+        np.copyto(self.frames[slot], frame)
+        with self.lock:
+            self.monotonic[slot] = mono
+            self.fixes[slot] = fix
+            self.frame_no[slot] = frame_no
+            self.count += 1
+
+    def nearest(self, gps_time=None):
+        """
+        Copy of the frame whose GPS time is nearest gps_time (latest if None),
+        as (frame, fix, monotonic, frame_no), or None if empty.
+        """
+        with self.lock:
+            if self.count == 0:
+                return None
+            if gps_time is None:
+                k = self.count - 1
+            else:
+                # Binary search over the window in capture order
+                lo, hi = 0, self.count
+                while lo < hi:
+                    mid = (lo + hi) // 2
+                    if self.gps_time[(self.start + mid) % self.capacity] < gps_time:
+                        lo = mid + 1
+                    else:
+                        hi = mid
+                k = min(lo, self.count - 1)
+                if k > 0:
+                    before = self.gps_time[(self.start + k - 1) % self.capacity]
+                    if gps_time - before < self.gps_time[(self.start + k) % self.capacity] - gps_time:
+                        k -= 1
+            slot = (self.start + k) % self.capacity
+            return (self.frames[slot].copy(), tuple(self.fixes[slot].tolist()),
+                    float(self.monotonic[slot]), int(self.frame_no[slot]))
+
+    def status(self):
+        with self.lock:
+            if self.count == 0:
+                return {"capacity": self.capacity, "frames": 0,
+                        "resets": self.resets, "skipped": self.skipped}
+            first = self.start
+            last = (self.start + self.count - 1) % self.capacity
+            return {
+                "capacity": self.capacity,
+                "frames": self.count,
+                "time_source": self.source,
+                "resets": self.resets,
+                "skipped": self.skipped,
+                "mb": round(self.frames.nbytes / 1024 / 1024, 1),
+                "oldest_gps_time": float(self.gps_time[first]),
+                "newest_gps_time": float(self.gps_time[last])
+            }
 
 gps_state = GPSState()
+frame_exchange = FrameExchange()
+frame_ring = FrameRing()
 frame_counter = 0
-current_frame = None
-frame_lock = threading.Lock()
 
 # ============== NMEA PARSER ==============
-def parse_nmea(sentence):
-    """Parse NMEA sentences from GPS module."""
-    global gps_state
+NMEA_MAX_LINE = 128  # NMEA 0183 allows 82; longer runs without a newline are noise
 
-    try:
-        if not sentence.startswith('$'):
-            return
+class NMEAParser:
+    """
+    Incremental NMEA 0183 parser. feed() takes raw serial bytes in chunks
+    of any size; complete sentences are checksum-verified and applied to
+    `state` (a GPSState). Works offline on recorded byte streams.
+    """
 
-        # Remove checksum
-        if '*' in sentence:
-            sentence = sentence.split('*')[0]
-
-        parts = sentence.split(',')
-        msg_type = parts[0]
-
-        with gps_state.lock:
-            # $GPGGA - Fix information
-            if msg_type in ['$GPGGA', '$GNGGA']:
-                if len(parts) >= 10:
-                    # Time
-                    if parts[1]:
-                        time_str = parts[1]
-                        hour = int(time_str[0:2])
-                        minute = int(time_str[2:4])
-                        second = float(time_str[4:])
-                        today = datetime.now(timezone.utc).date()
-                        gps_state.timestamp = datetime(
-                            today.year, today.month, today.day,
-                            hour, minute, int(second),
-                            int((second % 1) * 1000000),
-                            tzinfo=timezone.utc
-                        )
-
-                    # Latitude
-                    if parts[2] and parts[3]:
-                        lat = float(parts[2])
-                        lat_deg = int(lat / 100)
-                        lat_min = lat - (lat_deg * 100)
-                        gps_state.latitude = lat_deg + (lat_min / 60)
-                        if parts[3] == 'S':
-                            gps_state.latitude = -gps_state.latitude
-
-                    # Longitude
-                    if parts[4] and parts[5]:
-                        lon = float(parts[4])
-                        lon_deg = int(lon / 100)
-                        lon_min = lon - (lon_deg * 100)
-                        gps_state.longitude = lon_deg + (lon_min / 60)
-                        if parts[5] == 'W':
-                            gps_state.longitude = -gps_state.longitude
-
-                    # Fix quality
-                    if parts[6]:
-                        gps_state.fix_quality = int(parts[6])
-
-                    # Satellites
-                    if parts[7]:
-                        gps_state.satellites = int(parts[7])
-
-                    # Altitude
-                    if parts[9]:
-                        gps_state.altitude = float(parts[9])
-
-                    gps_state.last_update = time.time()
-
-            # $GPRMC - Recommended minimum (has speed and heading)
-            elif msg_type in ['$GPRMC', '$GNRMC']:
-                if len(parts) >= 8:
-                    # Speed in knots
-                    if parts[7]:
-                        gps_state.speed_knots = float(parts[7])
-                        gps_state.speed_kmh = gps_state.speed_knots * 1.852
-
-                    # Heading/course
-                    if len(parts) >= 9 and parts[8]:
-                        gps_state.heading = float(parts[8])
-
-            # $GPVTG - Course and speed
-            elif msg_type in ['$GPVTG', '$GNVTG']:
-                if len(parts) >= 8:
-                    # True heading
-                    if parts[1]:
-                        gps_state.heading = float(parts[1])
-                    # Speed in km/h
-                    if parts[7]:
-                        gps_state.speed_kmh = float(parts[7])
-
-    except (ValueError, IndexError) as e:
-        pass  # Skip malformed sentences
+    def __init__(self, state):
+        self.state = state
+        self.buffer = bytearray()
+        self.date_epoch = None  # UTC midnight of the current GPS date, from RMC
+        self.date_field = None  # RMC ddmmyy that date_epoch came from
+        self.last_tod = None    # Last GGA/RMC time of day under date_epoch, to catch midnight
+        self.sentences = 0      # Checksum-valid sentences
+        self.corrupt = 0        # Bad or missing checksum
+        self.malformed = 0      # Valid checksum but unparseable fields
+        self.overflows = 0      # Garbage discarded for lack of a newline
+
+    def feed(self, data):
+        """Parse every complete sentence in buffer + data; keep the partial tail."""
+        buf = self.buffer
+        buf += data
+        start = 0
+        while True:
+            end = buf.find(b'\n', start)
+            if end < 0:
+                break
+            dollar = buf.find(b'$', start, end)
+            if dollar >= 0:
+                self.sentence(bytes(buf[dollar:end]).rstrip())
+            start = end + 1
+        if start:
+            del buf[:start]
+        if len(buf) > NMEA_MAX_LINE:
+            self.overflows += 1
+            dollar = buf.rfind(b'$')
+            del buf[:dollar if dollar > 0 else len(buf)]
+
+    def sentence(self, line):
+        """Verify and apply one sentence (bytes from '$', no line ending)."""
+        star = line.find(b'*')
+        if star < 0 or len(line) < star + 3:
+            self.corrupt += 1
+            return
+        checksum = nmea_checksum(line[1:star])
+        try:
+            valid = checksum == int(line[star + 1:star + 3], 16)
+        except ValueError:
+            valid = False
+        if not valid:
+            self.corrupt += 1
+            return
+        self.sentences += 1
+
+        parts = line[:star].split(b',')
+        msg_type = parts[0][3:]  # Any talker: GP, GN, GL, GA, GB
+        try:
+            if msg_type == b'GGA':
+                self.gga(parts)
+            elif msg_type == b'RMC':
+                self.rmc(parts)
+            elif msg_type == b'VTG':
+                self.vtg(parts)
+        except (ValueError, IndexError):
+            self.malformed += 1
+
+    def gga(self, parts):
+        """$GPGGA - Fix information."""
+        if len(parts) < 10:
+            raise IndexError
+        gps_time = None
+        if parts[1]:
+            tod = nmea_time_of_day(parts[1])
+            if self.date_epoch is None:
+                # No RMC date yet; system date once, not per sentence
+                today = datetime.now(timezone.utc).date()
+                self.date_epoch = datetime(today.year, today.month, today.day,
+                                           tzinfo=timezone.utc).timestamp()
+            elif self.last_tod is not None and tod < self.last_tod - 43200:
+                self.date_epoch += 86400  # Midnight before the next RMC
+            self.last_tod = tod
+            gps_time = self.date_epoch + tod
+        latitude = nmea_degrees(parts[2], parts[3], b'S')
+        longitude = nmea_degrees(parts[4], parts[5], b'W')
+        fix_quality = int(parts[6]) if parts[6] else None
+        satellites = int(parts[7]) if parts[7] else None
+        altitude = float(parts[9]) if parts[9] else None
+
+        state = self.state
+        with state.lock:
+            if gps_time is not None:
+                state.gps_time = gps_time
+                state.fix_monotonic = time.monotonic()
+            if latitude is not None:
+                state.latitude = latitude
+            if longitude is not None:
+                state.longitude = longitude
+            if fix_quality is not None:
+                state.fix_quality = fix_quality
+            if satellites is not None:
+                state.satellites = satellites
+            if altitude is not None:
+                state.altitude = altitude
+            state.last_update = time.time()
+
+    def rmc(self, parts):
+        """$GPRMC - Recommended minimum (has speed, heading and date)."""
+        if len(parts) < 8:
+            raise IndexError
+        speed_knots = float(parts[7]) if parts[7] else None
+        heading = float(parts[8]) if len(parts) >= 9 and parts[8] else None
+        tod = nmea_time_of_day(parts[1]) if parts[1] else None
+        if len(parts) >= 10 and len(parts[9]) == 6 and parts[9] != self.date_field:
+            d = self.date_field = parts[9]
+            self.date_epoch = datetime(2000 + int(d[4:6]), int(d[2:4]), int(d[0:2]),
+                                       tzinfo=timezone.utc).timestamp()
+            self.last_tod = tod  # New date already covers this time; GGA must not roll again
+        elif tod is not None and self.date_field is not None:
+            self.last_tod = tod
+
+        state = self.state
+        with state.lock:
+            if speed_knots is not None:
+                state.speed_knots = speed_knots
+                state.speed_kmh = speed_knots * 1.852
+            if heading is not None:
+                state.heading = heading
+            speed_kmh, heading = state.speed_kmh, state.heading
+
+        # A valid RMC is a complete timed fix; keep it for interpolation
+        if parts[2] == b'A' and parts[1] and self.date_field is not None:
+            latitude = nmea_degrees(parts[3], parts[4], b'S')
+            longitude = nmea_degrees(parts[5], parts[6], b'W')
+            if latitude is not None and longitude is not None:
+                state.history.add(time.monotonic(), self.date_epoch + tod,
+                                  latitude, longitude, speed_kmh, heading)
+
+    def vtg(self, parts):
+        """$GPVTG - Course and speed."""
+        if len(parts) < 8:
+            raise IndexError
+        heading = float(parts[1]) if parts[1] else None
+        speed_kmh = float(parts[7]) if parts[7] else None
+
+        state = self.state
+        with state.lock:
+            if heading is not None:
+                state.heading = heading
+            if speed_kmh is not None:
+                state.speed_kmh = speed_kmh
+
+    def stats(self):
+        return {"sentences": self.sentences, "corrupt": self.corrupt,
+                "malformed": self.malformed, "overflows": self.overflows}
+
+def nmea_time_of_day(value):
+    """hhmmss.ss to seconds since UTC midnight."""
+    return int(value[0:2]) * 3600 + int(value[2:4]) * 60 + float(value[4:])
+
+def nmea_degrees(value, hemisphere, negative):
+    """ddmm.mmmm (or dddmm.mmmm) plus hemisphere to signed decimal degrees."""
+    if not value or not hemisphere:
+        return None
+    v = float(value)
+    degrees = int(v / 100)
+    degrees += (v - degrees * 100) / 60
+    return -degrees if hemisphere == negative else degrees
+
+def nmea_checksum(body):
+    """XOR of all bytes, eight at a time."""
+    x = 0
+    for word in memoryview(body + bytes(-len(body) % 8)).cast('Q'):
+        x ^= word
+    x ^= x >> 32
+    x ^= x >> 16
+    x ^= x >> 8
+    return x & 0xFF
+
+def nmea_sentence(body):
+    """'GPGGA,...' -> b'$GPGGA,...*hh\\r\\n' with its checksum."""
+    checksum = nmea_checksum(body.encode('ascii'))
+    return f"${body}*{checksum:02X}\r\n".encode('ascii')
+
+def synthetic_nmea(seconds=60, rate_hz=25, corrupt_every=50, start=0.0, rmc_first=False):
+    """
+    Recorded-looking GGA/RMC/VTG byte stream with some corrupted sentences.
+    `start` is seconds after 2026-10-18 00:00 UTC, so a start just before
+    86400 crosses midnight; rmc_first uses the u-blox RMC, GGA, VTG order.
+    """
+    out = bytearray()
+    count = 0
+    for k in range(int(seconds * rate_hz)):
+        t = start + k / rate_hz
+        hh, mm, ss = int(t // 3600) % 24, int(t // 60) % 60, t % 60
+        stamp = f"{hh:02d}{mm:02d}{ss:05.2f}"
+        date = f"{18 + int(t // 86400):02d}1026"
+        lat = 2529.5 + 0.01 * math.sin(t / 30)
+        lon = 5137.5 + 0.01 * math.cos(t / 30)
+        gga = f"GNGGA,{stamp},{lat:.5f},N,{lon:.5f},E,1,12,0.8,12.3,M,-25.0,M,,"
+        rmc = f"GNRMC,{stamp},A,{lat:.5f},N,{lon:.5f},E,{20 + 5 * math.sin(t):.2f},{(t * 6) % 360:.1f},{date},,,A"
+        vtg = f"GNVTG,{(t * 6) % 360:.1f},T,,M,{20 + 5 * math.sin(t):.2f},N,{37 + 9 * math.sin(t):.2f},K,A"
+        for body in ((rmc, gga, vtg) if rmc_first else (gga, rmc, vtg)):
+            sentence = bytearray(nmea_sentence(body))
+            count += 1
+            if corrupt_every and count % corrupt_every == 0:
+                sentence[10] ^= 0x01
+            out += sentence
+    return bytes(out)
+
+def bench_nmea(path=None, chunk=64, min_seconds=2.0):
+    """Print parser throughput (sentences/s) over a recorded NMEA file or synthetic data."""
+    if path:
+        with open(path, 'rb') as f:
+            data = f.read()
+        print(f"[GPS] Benchmarking {len(data)} bytes from {path}")
+    else:
+        data = synthetic_nmea()
+        print(f"[GPS] Benchmarking {len(data)} bytes of synthetic 25 Hz NMEA")
+
+    parser = NMEAParser(GPSState())
+    passes = 0
+    start = time.perf_counter()
+    while passes == 0 or time.perf_counter() - start < min_seconds:
+        for i in range(0, len(data), chunk):
+            parser.feed(data[i:i + chunk])  # Serial-sized reads, split mid-sentence
+        passes += 1
+    elapsed = time.perf_counter() - start
+    total = parser.sentences + parser.corrupt
+    print(f"[GPS] {total / elapsed:,.0f} sentences/s "
+          f"({passes * len(data) / elapsed / 1e6:.1f} MB/s), {parser.stats()}")
+    return parser
+
+nmea_parser = NMEAParser(gps_state)
 
 def gps_reader_thread():
     """Thread to continuously read GPS data."""
@@ -181,19 +674,11 @@ def gps_reader_thread():
         ser = serial.Serial(GPS_PORT, GPS_BAUD, timeout=1)
         print("[GPS] Serial port opened successfully")
 
-        buffer = ""
         while True:
             try:
                 data = ser.read(ser.in_waiting or 1)
                 if data:
-                    buffer += data.decode('ascii', errors='ignore')
-
-                    # Process complete sentences
-                    while '\n' in buffer:
-                        line, buffer = buffer.split('\n', 1)
-                        line = line.strip()
-                        if line.startswith('$'):
-                            parse_nmea(line)
+                    nmea_parser.feed(data)
 
             except Exception as e:
                 print(f"[GPS] Read error: {e}")
@@ -206,13 +691,17 @@ def gps_reader_thread():
 # ============== MQTT CLIENT ==============
 mqtt_client = None
 
-def mqtt_connect():
-    """Connect to MQTT broker."""
+def mqtt_connect(broker=MQTT_BROKER, port=MQTT_PORT, username=MQTT_USER,
+                 password=MQTT_PASS, tls=True):
+    """Connect to MQTT broker in the background; paho keeps reconnecting."""
     global mqtt_client
 
     mqtt_client = mqtt.Client(client_id=f"pi_camera_{int(time.time())}")
-    mqtt_client.username_pw_set(MQTT_USER, MQTT_PASS)
-    mqtt_client.tls_set()
+    if username:
+        mqtt_client.username_pw_set(username, password)
+    if tls:
+        mqtt_client.tls_set()
+    mqtt_client.reconnect_delay_set(min_delay=1, max_delay=MQTT_RECONNECT_MAX_S)
 
     def on_connect(client, userdata, flags, rc):
         if rc == 0:
@@ -220,26 +709,401 @@ def mqtt_connect():
         else:
             print(f"[MQTT] Connection failed: {rc}")
 
+    def on_disconnect(client, userdata, rc):
+        print(f"[MQTT] Disconnected ({rc}); spooling GPS until reconnected")
+
     mqtt_client.on_connect = on_connect
+    mqtt_client.on_disconnect = on_disconnect
 
-    try:
-        mqtt_client.connect(MQTT_BROKER, MQTT_PORT, 60)
-        mqtt_client.loop_start()
-        print(f"[MQTT] Connecting to {MQTT_BROKER}...")
-    except Exception as e:
-        print(f"[MQTT] Connection error: {e}")
+    # connect_async so a car without signal at boot still connects later
+    mqtt_client.connect_async(broker, port, 60)
+    mqtt_client.loop_start()
+    print(f"[MQTT] Connecting to {broker}:{port}...")
+    return mqtt_client
+
+class Spool:
+    """
+    Bounded on-disk FIFO of JSON samples: numbered JSON-lines segment
+    files of up to `segment_samples` lines. When the spool grows past
+    `max_bytes` the oldest segment is deleted and its samples counted as
+    dropped. Segments left by a previous run are picked up again, minus
+    any partial last line a power cut left behind; the read position is
+    not persisted, so a restart resends the oldest segment from its
+    start (delivery is at least once). Lines that aren't valid JSON are
+    skipped and counted.
+    """
 
-def publish_gps():
-    """Publish GPS data to MQTT."""
-    if mqtt_client and mqtt_client.is_connected():
-        data = gps_state.to_dict()
+    def __init__(self, directory=MQTT_SPOOL_DIR, max_bytes=MQTT_SPOOL_MB * 1024 * 1024,
+                 segment_samples=MQTT_SPOOL_SEGMENT_SAMPLES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_samples = segment_samples
+        os.makedirs(directory, exist_ok=True)
+        self.segments = []  # [path, samples], oldest first
+        self.writer = None       # Open file of the newest segment
+        self.read_offset = 0     # Byte offset into the oldest segment
+        self.read_samples = 0    # Samples of the oldest segment already sent
+        self.dropped = 0
+        self.corrupt = 0
+        for name in sorted(os.listdir(directory)):
+            if name.endswith('.jsonl'):
+                self.resume(os.path.join(directory, name))
+        self.bytes = sum(os.path.getsize(path) for path, _ in self.segments)
+
+    def resume(self, path):
+        """Adopt a segment from an earlier run, cutting off an unterminated last line."""
+        with open(path, 'r+b') as f:
+            data = f.read()
+            end = data.rfind(b'\n') + 1
+            if end < len(data):
+                f.truncate(end)
+                self.corrupt += 1
+        if end == 0:
+            os.remove(path)
+            return
+        self.segments.append([path, data.count(b'\n', 0, end)])
+
+    def __len__(self):
+        return sum(samples for _, samples in self.segments) - self.read_samples
+
+    def append(self, sample):
+        line = json.dumps(sample).encode() + b'\n'
+        if self.writer is None or self.segments[-1][1] >= self.segment_samples:
+            if self.writer is not None:
+                self.writer.close()
+            seq = int(os.path.basename(self.segments[-1][0])[:-6]) + 1 if self.segments else 1
+            path = os.path.join(self.directory, f'{seq:012d}.jsonl')
+            self.writer = open(path, 'ab')
+            self.segments.append([path, 0])
+        self.writer.write(line)
+        self.writer.flush()
+        self.segments[-1][1] += 1
+        self.bytes += len(line)
+        while self.bytes > self.max_bytes and len(self.segments) > 1:
+            self.dropped += self.segments[0][1] - self.read_samples
+            self.remove_oldest()
+
+    def peek(self, count):
+        """
+        Up to `count` oldest unsent samples as JSON bytes, and the position
+        after them (which also covers any corrupt lines skipped on the way).
+        """
+        if not self.segments:
+            return [], None
+        lines = []
+        consumed = corrupt = 0
+        with open(self.segments[0][0], 'rb') as f:
+            f.seek(self.read_offset)
+            while len(lines) < count:
+                line = f.readline()
+                if not line.endswith(b'\n'):
+                    break
+                consumed += 1
+                try:
+                    json.loads(line)
+                except ValueError:
+                    corrupt += 1
+                    continue
+                lines.append(line[:-1])
+            return lines, (self.segments[0][0], f.tell(), self.read_samples + consumed, corrupt)
+
+    def commit(self, position):
+        """Forget samples up to a position from peek() once they are delivered."""
+        path, offset, samples, corrupt = position
+        if not self.segments or self.segments[0][0] != path:
+            return  # Segment was dropped for space meanwhile
+        self.read_offset, self.read_samples = offset, samples
+        self.corrupt += corrupt
+        if samples >= self.segments[0][1]:
+            self.remove_oldest()
+
+    def remove_oldest(self):
+        path, _ = self.segments.pop(0)
+        if not self.segments and self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        self.bytes -= os.path.getsize(path)
+        os.remove(path)
+        self.read_offset = self.read_samples = 0
+
+class GPSPublisher:
+    """
+    Publishes GPS to MQTT from its own thread, independent of the camera.
+
+    Samples are taken on an absolute MQTT_PUBLISH_HZ schedule, interpolated
+    to each tick. While connected they go straight to MQTT_TOPIC_GPS;
+    otherwise they go to the on-disk spool. After reconnecting, the spool
+    drains to MQTT_TOPIC_GPS_BACKLOG in batches of up to
+    MQTT_DRAIN_BATCH samples, at most MQTT_DRAIN_HZ batches per second and
+    one unacknowledged batch at a time (QoS 1), while live samples keep
+    going out on schedule. Any object with paho's is_connected() and
+    publish() works as the client, so a local stand-in can drive it.
+    """
+
+    def __init__(self, client, spool, rate_hz=MQTT_PUBLISH_HZ):
+        self.client = client
+        self.spool = spool
+        self.interval = 1.0 / rate_hz
+        self.inflight = None  # (MQTTMessageInfo, spool position, samples, sent at)
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.published = 0
+        self.spooled = 0
+        self.drained = 0
+        self.skipped = 0
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def run(self):
+        next_tick = next_drain = time.monotonic()
+        while not self.stop_event.is_set():
+            now = time.monotonic()
+            if now >= next_tick:
+                self.tick(next_tick)
+                next_tick += self.interval
+                if next_tick <= now:
+                    # Stalled for more than a period: skip, don't burst
+                    missed = math.ceil((now - next_tick) / self.interval)
+                    self.skipped += missed
+                    next_tick += missed * self.interval
+            if now >= next_drain:
+                next_drain = now + (1.0 / MQTT_DRAIN_HZ if self.drain(now) else self.interval)
+            self.stop_event.wait(max(min(next_tick, next_drain) - time.monotonic(), 0))
+
+    def sample(self, mono):
+        data = gps_state.to_dict(at=mono)
         data["source"] = "pi_gps"
-        mqtt_client.publish(MQTT_TOPIC_GPS, json.dumps(data), qos=0)
+        return data
+
+    def tick(self, mono):
+        """Publish (or spool) the sample for one scheduled instant."""
+        data = self.sample(mono)
+        if self.client.is_connected():
+            info = self.client.publish(MQTT_TOPIC_GPS, json.dumps(data), qos=0)
+            if info.rc == 0:
+                self.published += 1
+                return
+        self.spool.append(data)
+        self.spooled += 1
+
+    def drain(self, now):
+        """Send the next backlog batch if the last one was acknowledged. True while draining."""
+        if self.inflight is not None:
+            info, position, samples, sent_at = self.inflight
+            if info.is_published():
+                self.spool.commit(position)
+                self.drained += samples
+                self.inflight = None
+            elif now - sent_at < MQTT_DRAIN_ACK_TIMEOUT_S:
+                return True
+            else:
+                self.inflight = None  # Lost with the connection; resend from the spool
+
+        if not self.client.is_connected():
+            return False
+        lines, position = self.spool.peek(MQTT_DRAIN_BATCH)
+        if not lines:
+            if position is not None:
+                self.spool.commit(position)  # Only corrupt lines were left
+            return len(self.spool) > 0
+        payload = b'{"source": "pi_gps", "samples": [' + b', '.join(lines) + b']}'
+        info = self.client.publish(MQTT_TOPIC_GPS_BACKLOG, payload, qos=1)
+        if info.rc == 0:
+            self.inflight = (info, position, len(lines), now)
+        return True
+
+    def status(self):
+        return {
+            "published": self.published,
+            "spooled": self.spooled,
+            "backlog": len(self.spool),
+            "drained": self.drained,
+            "spool_dropped": self.spool.dropped,
+            "spool_corrupt": self.spool.corrupt,
+            "skipped_ticks": self.skipped
+        }
+
+gps_publisher = None
+
+# ============== RECORDING ==============
+# Each run is a directory of segments: seg_<first frame>.mjpeg holds the
+# JPEG frames back to back (plays in ffplay/VLC as MJPEG) and
+# seg_<first frame>.idx holds one fixed-size INDEX_RECORD per frame, so a
+# frame is found by binary search without reading the video.
+INDEX_MAGIC = b'PSUIDX1\n'
+INDEX_RECORD = struct.Struct('<qQIddddff')
+INDEX_FIELDS = ('frame_no', 'offset', 'length', 'pi_time', 'gps_time',
+                'latitude', 'longitude', 'speed_kmh', 'heading')
+
+class Recorder:
+    """
+    Background recorder. The camera thread copies frames into a fixed pool
+    of buffers and queues them; a writer thread encodes and writes them.
+    When the pool is exhausted (disk or encoder behind) frames are dropped
+    and counted instead of blocking capture.
+    """
+
+    def __init__(self, root=RECORD_DIR, pool_size=RECORD_QUEUE_FRAMES,
+                 segment_frames=RECORD_SEGMENT_FRAMES):
+        self.root = root
+        self.pool_size = pool_size
+        self.segment_frames = segment_frames
+        self.pool = None
+        self.free = queue.Queue()
+        self.pending = queue.Queue()
+        self.run_dir = None
+        self.running = False
+        self.thread = None
+        self.segments = 0
+        self.written = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def start(self):
+        self.run_dir = os.path.join(self.root, datetime.now().strftime('run_%Y%m%d_%H%M%S'))
+        os.makedirs(self.run_dir, exist_ok=True)
+        self.running = True
+        self.thread = threading.Thread(target=self.writer_thread, daemon=True)
+        self.thread.start()
+        print(f"[REC] Recording to {self.run_dir}")
+
+    def stop(self):
+        """Write out queued frames and close the current segment."""
+        if not self.running:
+            return
+        self.running = False
+        self.pending.put(None)
+        self.thread.join()
+        print(f"[REC] Stopped: {self.written} frames written, {self.dropped} dropped")
+
+    def submit(self, frame, captured, frame_no, fix):
+        """Queue a frame and its GPS fix for recording (camera thread). Never blocks."""
+        if not self.running:
+            return
+        if self.pool is None:
+            self.pool = np.zeros((self.pool_size,) + frame.shape, dtype=frame.dtype)
+            for slot in range(self.pool_size):
+                self.free.put(slot)
+        try:
+            slot = self.free.get_nowait()
+        except queue.Empty:
+            self.dropped += 1
+            return
+        np.copyto(self.pool[slot], frame)
+        pi_time = time.time() - (time.monotonic() - captured)
+        self.pending.put((slot, frame_no, pi_time) + tuple(fix))
+
+    def writer_thread(self):
+        video = index = None
+        in_segment = 0
+        while True:
+            item = self.pending.get()
+            if item is None:
+                break
+            slot, frame_no = item[0], item[1]
+            try:
+                ret, jpeg = cv2.imencode('.jpg', self.pool[slot],
+                                         [cv2.IMWRITE_JPEG_QUALITY, RECORD_JPEG_QUALITY])
+            finally:
+                self.free.put(slot)
+            if not ret:
+                self.errors += 1
+                continue
+
+            try:
+                if video is None or in_segment >= self.segment_frames:
+                    if video is not None:
+                        video.close()
+                        index.close()
+                    name = os.path.join(self.run_dir, f'seg_{frame_no:08d}')
+                    video = open(name + '.mjpeg', 'wb')
+                    index = open(name + '.idx', 'wb')
+                    index.write(INDEX_MAGIC)
+                    in_segment = 0
+                    self.segments += 1
+
+                data = jpeg.tobytes()
+                index.write(INDEX_RECORD.pack(frame_no, video.tell(), len(data), *item[2:]))
+                video.write(data)
+                in_segment += 1
+                self.written += 1
+                if in_segment % RECORD_FLUSH_FRAMES == 0:
+                    video.flush()
+                    index.flush()
+            except OSError as e:
+                self.errors += 1
+                if self.errors == 1 or self.errors % 100 == 0:
+                    print(f"[REC] Write error ({self.errors}): {e}")
+                for f in (video, index):
+                    try:
+                        f.close()
+                    except (OSError, AttributeError):
+                        pass
+                video = index = None
+
+        if video is not None:
+            video.close()
+            index.close()
+
+    def status(self):
+        return {
+            "recording": self.running,
+            "dir": self.run_dir,
+            "segments": self.segments,
+            "written": self.written,
+            "dropped": self.dropped,
+            "errors": self.errors,
+            "queued": self.pending.qsize()
+        }
+
+def recorded_frame(run_dir, frame_no):
+    """
+    (jpeg bytes, index record dict) of a recorded frame, or the next one
+    recorded after it if it was dropped; None past the end of the run.
+    For post-race tools.
+    """
+    firsts = sorted(int(name[4:-4]) for name in os.listdir(run_dir)
+                    if name.startswith('seg_') and name.endswith('.idx'))
+    k = bisect.bisect_right(firsts, frame_no) - 1
+    for first in firsts[max(k, 0):]:
+        name = os.path.join(run_dir, f'seg_{first:08d}')
+        with open(name + '.idx', 'rb') as index:
+            if index.read(len(INDEX_MAGIC)) != INDEX_MAGIC:
+                raise ValueError(f"{name}.idx is not a recording index")
+            count = (os.path.getsize(name + '.idx') - len(INDEX_MAGIC)) // INDEX_RECORD.size
+
+            def record(i):
+                index.seek(len(INDEX_MAGIC) + i * INDEX_RECORD.size)
+                return INDEX_RECORD.unpack(index.read(INDEX_RECORD.size))
+
+            lo, hi = 0, count
+            while lo < hi:
+                mid = (lo + hi) // 2
+                if record(mid)[0] < frame_no:
+                    lo = mid + 1
+                else:
+                    hi = mid
+            if lo == count:
+                continue
+            fields = dict(zip(INDEX_FIELDS, record(lo)))
+        with open(name + '.mjpeg', 'rb') as video:
+            video.seek(fields['offset'])
+            return video.read(fields['length']), fields
+    return None
+
+recorder = Recorder()
 
 # ============== CAMERA CAPTURE ==============
 def camera_capture_thread():
     """Thread to capture camera frames."""
-    global current_frame, frame_counter
+    global frame_counter
 
     print(f"[CAM] Opening camera {CAMERA_DEVICE}...")
 
@@ -262,11 +1126,11 @@ def camera_capture_thread():
 
     print(f"[CAM] Camera opened: {actual_w}x{actual_h} @ {actual_fps}fps")
 
-    last_mqtt_time = 0
-    mqtt_interval = 0.5  # Send GPS every 500ms
-
     while True:
-        ret, frame = cap.read()
+        # Capture straight into a free buffer (allocated on first use)
+        index = frame_exchange.writable()
+        ret, frame = cap.read(frame_exchange.buffers[index])
+        captured = time.monotonic()
         if not ret:
             print("[CAM] Frame capture failed")
             time.sleep(0.01)
@@ -274,49 +1138,148 @@ def camera_capture_thread():
 
         frame_counter += 1
 
-        # Store frame for HTTP streaming
-        with frame_lock:
-            current_frame = frame.copy()
+        # Hand the frame to the stream without copying it
+        frame_exchange.publish(index, frame)
 
-        # Publish GPS data periodically
-        now = time.time()
-        if now - last_mqtt_time >= mqtt_interval:
-            publish_gps()
-            last_mqtt_time = now
+        # Keep a copy tagged with the GPS fix at capture time for /frame?t=
+        fix = gps_state.fix_at(captured)
+        frame_ring.add(frame, captured, fix, frame_counter, gps_state.time_source())
 
-        time.sleep(0.001)  # Small delay to prevent CPU overload
+        # Queue for the background recorder (drops rather than waits)
+        recorder.submit(frame, captured, frame_counter, fix)
 
-# ============== HTTP MJPEG STREAM ==============
-app = Flask(__name__)
+        time.sleep(0.001)  # Small delay to prevent CPU overload
 
-def generate_mjpeg():
-    """Generate MJPEG stream with GPS metadata."""
-    global current_frame
+# ============== MJPEG ENCODER ==============
+class StreamVariant:
+    """
+    One stream variant (width, JPEG quality, max fps). Its encoder thread
+    encodes each new frame once and shares the bytes with every client of
+    the variant; extra viewers only cost a socket write. The thread exits
+    and the variant is dropped when its last client disconnects.
+    """
 
-    while True:
-        with frame_lock:
-            if current_frame is None:
-                time.sleep(0.01)
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+        width, quality, max_fps = key
+        self.width = width          # None keeps the capture resolution
+        self.quality = quality
+        self.interval = 1.0 / max_fps if max_fps else 0.0
+        self.cond = threading.Condition()
+        self.chunk = None           # Multipart chunk of the latest encoded frame
+        self.seq = 0                # frame_exchange sequence number of that frame
+        self.clients = 0            # Guarded by registry.lock
+        self.encoded = 0
+        self.stopped = False
+
+    def encoder_thread(self):
+        """Encode new frames, at most once per interval, until no clients are left."""
+        last = 0
+        last_encode = 0.0
+        while not self.registry.retire_if_idle(self):
+            wait = last_encode + self.interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+
+            got = frame_exchange.acquire(last)
+            if got is None:
+                continue
+            last, index, frame = got
+            try:
+                chunk = self.encode(frame)
+            finally:
+                frame_exchange.release(index)
+            last_encode = time.monotonic()
+            if chunk is None:
                 continue
-            frame = current_frame.copy()
 
-        # Get current GPS data
-        gps_data = gps_state.to_dict()
+            with self.cond:
+                self.chunk = chunk
+                self.seq = last
+                self.encoded += 1
+                self.cond.notify_all()
 
+    def encode(self, frame):
+        """Multipart chunk for one frame, or None if encoding failed."""
         # Optionally overlay GPS info on frame (for debugging)
         # Uncomment to see GPS data on video:
+        # gps_data = gps_state.to_dict()
+        # frame = frame.copy()
         # cv2.putText(frame, f"GPS: {gps_data['latitude']:.6f}, {gps_data['longitude']:.6f}",
         #             (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
         # cv2.putText(frame, f"Speed: {gps_data['speed_kmh']:.1f} km/h",
         #             (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
 
-        # Encode frame
-        ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, JPEG_QUALITY])
+        height, width = frame.shape[:2]
+        if self.width and self.width < width:
+            size = (self.width, max(int(height * self.width / width), 1))
+            frame = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+
+        ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
         if not ret:
-            continue
+            return None
+        return (b'--frame\r\n'
+                b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
+
+    def frames(self):
+        """Shared multipart chunks, one per newly encoded frame."""
+        seen = 0
+        while not self.stopped:
+            with self.cond:
+                if not self.cond.wait_for(lambda: self.seq != seen, timeout=1.0):
+                    continue
+                seen, chunk = self.seq, self.chunk
+            yield chunk
+
+class StreamVariants:
+    """Live stream variants keyed by (width, quality, max_fps)."""
+
+    def __init__(self):
+        self.variants = {}
+        self.lock = threading.Lock()
+
+    def frames(self, width=None, quality=JPEG_QUALITY, max_fps=None):
+        """Per-client generator; joins (or starts) the matching variant."""
+        key = (width, quality, max_fps)
+        with self.lock:
+            variant = self.variants.get(key)
+            if variant is None:
+                variant = self.variants[key] = StreamVariant(self, key)
+                threading.Thread(target=variant.encoder_thread, daemon=True).start()
+                print(f"[HTTP] Stream variant started: width={width} quality={quality} fps={max_fps}")
+            variant.clients += 1
+        try:
+            yield from variant.frames()
+        finally:
+            with self.lock:
+                variant.clients -= 1
+
+    def retire_if_idle(self, variant):
+        """Called by a variant's encoder; drops the variant once it has no clients."""
+        with self.lock:
+            if variant.clients > 0:
+                return False
+            variant.stopped = True
+            if self.variants.get(variant.key) is variant:
+                del self.variants[variant.key]
+        print(f"[HTTP] Stream variant stopped: width={variant.width} quality={variant.quality}")
+        return True
+
+    def status(self):
+        with self.lock:
+            return [{"width": key[0], "quality": key[1], "max_fps": key[2],
+                     "clients": variant.clients, "encoded": variant.encoded}
+                    for key, variant in self.variants.items()]
+
+stream_variants = StreamVariants()
+
+# ============== HTTP MJPEG STREAM ==============
+app = Flask(__name__)
 
-        yield (b'--frame\r\n'
-               b'Content-Type: image/jpeg\r\n\r\n' + jpeg.tobytes() + b'\r\n')
+def generate_mjpeg(width=None, quality=JPEG_QUALITY, max_fps=None):
+    """Generate MJPEG stream; clients asking for the same variant share one encoder."""
+    return stream_variants.frames(width, quality, max_fps)
 
 @app.route('/')
 def index():
@@ -338,16 +1301,84 @@ def index():
 
 @app.route('/stream')
 def stream():
-    """MJPEG stream endpoint."""
+    """
+    MJPEG stream endpoint.
+    Optional query parameters: width (px), quality (JPEG 10-95), fps (max).
+    """
+    width = request.args.get('width', type=int)
+    quality = request.args.get('quality', JPEG_QUALITY, type=int)
+    max_fps = request.args.get('fps', type=float)
+
+    # Snap to a few sizes and rates so similar requests share a variant
+    if width is not None:
+        width = min(max(width // 32 * 32, 64), CAMERA_WIDTH)
+        if width == CAMERA_WIDTH:
+            width = None
+    quality = min(max(quality, 10), 95)
+    if max_fps is not None:
+        max_fps = min(max(round(max_fps), 1), CAMERA_FPS)
+        if max_fps == CAMERA_FPS:
+            max_fps = None
+
     return Response(
-        generate_mjpeg(),
+        generate_mjpeg(width, quality, max_fps),
         mimetype='multipart/x-mixed-replace; boundary=frame'
     )
 
+def parse_gps_time(value):
+    """GPS time from epoch seconds or ISO 8601 (UTC if no offset)."""
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    ts = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts.timestamp()
+
+@app.route('/frame')
+def frame_at():
+    """
+    JPEG of the buffered frame nearest GPS time t (epoch seconds or ISO 8601),
+    or the latest frame without t. Optional query parameter: quality.
+    """
+    t = request.args.get('t')
+    quality = min(max(request.args.get('quality', JPEG_QUALITY, type=int), 10), 95)
+    try:
+        gps_time = parse_gps_time(t) if t else None
+    except ValueError:
+        return Response(json.dumps({"error": f"Invalid t: {t}"}), status=400,
+                        mimetype='application/json')
+
+    found = frame_ring.nearest(gps_time)
+    if found is None:
+        return Response(json.dumps({"error": "No frames buffered"}), status=404,
+                        mimetype='application/json')
+    frame, (frame_gps_time, latitude, longitude, speed_kmh, heading), captured, frame_no = found
+    offset = frame_gps_time - gps_time if gps_time is not None else 0.0
+    if abs(offset) > FRAME_RING_TOLERANCE_S:
+        return Response(json.dumps({"error": "t is outside the buffered frames",
+                                    **frame_ring.status()}),
+                        status=404, mimetype='application/json')
+
+    ret, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ret:
+        return Response(json.dumps({"error": "Encoding failed"}), status=500,
+                        mimetype='application/json')
+    return Response(jpeg.tobytes(), mimetype='image/jpeg', headers={
+        "X-Frame-Number": str(frame_no),
+        "X-GPS-Time": f"{frame_gps_time:.3f}",
+        "X-GPS-Position": f"{latitude:.7f},{longitude:.7f}",
+        "X-GPS-Speed-Kmh": f"{speed_kmh:.2f}",
+        "X-GPS-Heading": f"{heading:.1f}",
+        "X-Capture-Monotonic": f"{captured:.6f}",
+        "X-Time-Offset": f"{offset:.3f}"
+    })
+
 @app.route('/gps')
 def gps_json():
     """Get current GPS data as JSON."""
-    return json.dumps(gps_state.to_dict())
+    return json.dumps(gps_state.to_dict(at=time.monotonic()))
 
 @app.route('/status')
 def status():
@@ -357,10 +1388,16 @@ def status():
             "device": CAMERA_DEVICE,
             "frames": frame_counter
         },
+        "stream_variants": stream_variants.status(),
+        "frame_ring": frame_ring.status(),
+        "recording": recorder.status(),
         "gps": gps_state.to_dict(),
+        "nmea": nmea_parser.stats(),
+        "gps_history": gps_state.history.status(),
         "mqtt": {
             "connected": mqtt_client.is_connected() if mqtt_client else False,
-            "broker": MQTT_BROKER
+            "broker": MQTT_BROKER,
+            "gps": gps_publisher.status() if gps_publisher else None
         }
     })
 
@@ -377,6 +1414,23 @@ def dashboard_files(filename):
 
 # ============== MAIN ==============
 def main():
+    global GPS_PORT, GPS_BAUD, MQTT_BROKER, gps_publisher
+
+    parser = argparse.ArgumentParser(description='PSU Racing GPS-synced camera streamer')
+    parser.add_argument('--record', action='store_true', help=f'record the run to {RECORD_DIR}')
+    parser.add_argument('--gps-port', default=GPS_PORT)
+    parser.add_argument('--gps-baud', type=int, default=GPS_BAUD)
+    parser.add_argument('--mqtt-broker', default=MQTT_BROKER)
+    parser.add_argument('--mqtt-port', type=int, default=MQTT_PORT)
+    parser.add_argument('--no-tls', action='store_true', help='plain MQTT, e.g. a local broker')
+    parser.add_argument('--bench-nmea', nargs='?', const='', metavar='FILE',
+                        help='benchmark the NMEA parser on a raw capture (or synthetic data) and exit')
+    args = parser.parse_args()
+    if args.bench_nmea is not None:
+        bench_nmea(args.bench_nmea or None)
+        return
+    GPS_PORT, GPS_BAUD = args.gps_port, args.gps_baud
+
     print("=" * 50)
     print("  PSU Racing - GPS-Synced Camera Streamer")
     print("=" * 50)
@@ -388,8 +1442,17 @@ def main():
     # Wait a moment for GPS to initialize
     time.sleep(1)
 
-    # Connect to MQTT
-    mqtt_connect()
+    # Connect to MQTT; GPS publishing runs on its own schedule from here on
+    local = args.mqtt_broker != MQTT_BROKER
+    MQTT_BROKER = args.mqtt_broker
+    mqtt_connect(args.mqtt_broker, args.mqtt_port,
+                 None if local else MQTT_USER, None if local else MQTT_PASS,
+                 tls=not args.no_tls)
+    gps_publisher = GPSPublisher(mqtt_client, Spool())
+    gps_publisher.start()
+
+    if args.record:
+        recorder.start()
 
     # Start camera capture thread
     cam_thread = threading.Thread(target=camera_capture_thread, daemon=True)
@@ -399,11 +1462,17 @@ def main():
     print(f"\n[HTTP] Starting server on port {HTTP_PORT}...")
     print(f"[HTTP] Dashboard: http://172.20.10.4:{HTTP_PORT}/app/")
     print(f"[HTTP] Stream URL: http://172.20.10.4:{HTTP_PORT}/stream")
+    print(f"[HTTP] Phone HUD:  http://172.20.10.4:{HTTP_PORT}/stream?width=640&quality=60&fps=15")
+    print(f"[HTTP] Frame at GPS time: http://172.20.10.4:{HTTP_PORT}/frame?t=<epoch or ISO>")
     print(f"[HTTP] Status URL: http://172.20.10.4:{HTTP_PORT}/status")
     print(f"\n[DASHBOARD] Serving files from: {DASHBOARD_DIR}")
     print("\nPress Ctrl+C to stop.\n")
 
-    app.run(host='0.0.0.0', port=HTTP_PORT, threaded=True)
+    try:
+        app.run(host='0.0.0.0', port=HTTP_PORT, threaded=True)
+    finally:
+        gps_publisher.stop()
+        recorder.stop()
 
 if __name__ == '__main__':
     main()
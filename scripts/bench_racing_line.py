@@ -0,0 +1,221 @@
+"""
+Latency benchmark for the racing line overlay API (api/racing_line.py).
+
+Drives find_nearest_point, gps_to_pixel, calculate_overlay and the full
+HTTP handler (through a local server) over synthetic positions around the
+Lusail line, plus recorded positions from an attempt CSV if given, at
+racing line densities from 47 to 50k points (source and resampled line
+alike). Prints throughput and p50/p99 latency and writes machine-readable
+results for comparing runs.
+
+Usage:
+    py scripts/bench_racing_line.py
+    py scripts/bench_racing_line.py --positions data/2025/Attempt/Attempt1.csv
+    py scripts/bench_racing_line.py --out after.json --compare before.json
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import platform
+import random
+import sys
+import threading
+import time
+import urllib.request
+from http.server import HTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import numpy as np
+import racing_line
+
+DENSITIES = [47, 500, 5000, 50000]
+SAMPLES = 2000              # Positions per benchmark
+HTTP_SAMPLES = 300          # Fewer for the HTTP round trip
+LATERAL_NOISE_M = 3.0       # Synthetic positions scatter this far off the line
+
+# ============== RACING LINES ==============
+def densify(outline, count):
+    """Interpolate the Lusail outline up to `count` points."""
+    if count <= len(outline):
+        return outline[:count]
+    per_span = math.ceil(count / (len(outline) - 1))
+    points = []
+    for a, b in zip(outline, outline[1:]):
+        for k in range(per_span):
+            t = k / per_span
+            points.append(dict(a, lat=a['lat'] + t * (b['lat'] - a['lat']),
+                               lon=a['lon'] + t * (b['lon'] - a['lon'])))
+    return points[:count]
+
+# ============== POSITIONS ==============
+def synthetic_positions(track, count, seed=1):
+    """Random positions scattered around the line, heading along it."""
+    rng = random.Random(seed)
+    positions = []
+    for _ in range(count):
+        i = rng.randrange(len(track))
+        j = (i + 1) % len(track)
+        de = track.east[j] - track.east[i]
+        dn = track.north[j] - track.north[i]
+        # Heading in the projection's convention (see enu_to_pixel)
+        heading = math.degrees(math.atan2(-de, dn))
+        lat = float(track.lat[i]) + rng.gauss(0, LATERAL_NOISE_M) / 111320
+        lon = float(track.lon[i]) + rng.gauss(0, LATERAL_NOISE_M) / 100500
+        positions.append({'latitude': lat, 'longitude': lon,
+                          'heading': heading, 'speed': rng.uniform(15, 35)})
+    return positions
+
+def recorded_positions(path, count):
+    """Moving GPS samples from an attempt CSV, heading from successive fixes."""
+    positions = []
+    prev = None
+    with open(path, 'r', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            try:
+                lat = float(row['gps_latitude'])
+                lon = float(row['gps_longitude'])
+                speed = float(row.get('gps_speed') or 0)
+            except (KeyError, ValueError):
+                continue
+            if lat == 0 or lon == 0 or speed < 2:
+                continue
+            heading = 0.0
+            if prev:
+                de = (lon - prev[1]) * 100500
+                dn = (lat - prev[0]) * 111320
+                heading = math.degrees(math.atan2(-de, dn))
+            prev = (lat, lon)
+            positions.append({'latitude': lat, 'longitude': lon,
+                              'heading': heading, 'speed': speed})
+            if len(positions) >= count:
+                break
+    return positions
+
+# ============== TIMING ==============
+def run(name, fn, args_list):
+    """Time fn(*args) for each args tuple; return a result record."""
+    times = np.empty(len(args_list))
+    start = time.perf_counter()
+    for k, args in enumerate(args_list):
+        t = time.perf_counter()
+        fn(*args)
+        times[k] = time.perf_counter() - t
+    elapsed = time.perf_counter() - start
+    return {
+        'name': name,
+        'calls': len(args_list),
+        'throughput_per_s': round(len(args_list) / elapsed, 1),
+        'p50_us': round(float(np.percentile(times, 50)) * 1e6, 2),
+        'p99_us': round(float(np.percentile(times, 99)) * 1e6, 2),
+        'mean_us': round(float(times.mean()) * 1e6, 2)
+    }
+
+def start_server():
+    server = HTTPServer(('127.0.0.1', 0), racing_line.handler)
+    server.RequestHandlerClass.log_message = lambda *args: None
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}/api/racing_line'
+
+def post(url, sample):
+    request = urllib.request.Request(url, data=json.dumps(sample).encode(),
+                                     headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        response.read()
+
+def bench_density(density, outline, positions_by_source, url):
+    """All benchmarks against a racing line of `density` source points."""
+    points = densify(outline, density)
+    # Resample to `density` points too, or every line becomes the same 1 m line
+    lap_length = racing_line.TrackGeometry.from_racing_line(points).lap_length
+    start = time.perf_counter()
+    racing_line.set_racing_line(points, racing_line.generate_default_segments(),
+                                spacing_m=lap_length / density)
+    load_ms = (time.perf_counter() - start) * 1000
+    track = racing_line.TRACK
+
+    # Measure computation, not cache hits
+    racing_line.RESPONSE_CACHE.max_size = 0
+
+    results = []
+    for source, positions in positions_by_source.items():
+        if positions is None:
+            positions = synthetic_positions(track, SAMPLES)
+        samples = [(p['latitude'], p['longitude'], p['heading'], p['speed']) for p in positions]
+        tag = f'{source}/{density}'
+
+        results.append(run(f'find_nearest_point/{tag}', racing_line.find_nearest_point,
+                           [s[:2] for s in samples]))
+
+        # Scalar projection of each position's lookahead window
+        windows = []
+        for lat, lon, heading, _ in samples[:200]:
+            idx = racing_line.find_nearest_point(lat, lon)[1]
+            for j in track.lookahead(idx, racing_line.LOOKAHEAD_M):
+                windows.append((float(track.lat[j]), float(track.lon[j]), lat, lon, heading))
+        results.append(run(f'gps_to_pixel/{tag}', racing_line.gps_to_pixel, windows))
+
+        results.append(run(f'calculate_overlay/{tag}', racing_line.calculate_overlay, samples))
+        results.append(run(f'handler/{tag}', post,
+                           [(url, p) for p in positions[:HTTP_SAMPLES]]))
+
+    for r in results:
+        r.update(density=density, track_points=len(track), load_ms=round(load_ms, 2))
+    return results
+
+# ============== REPORT ==============
+def print_table(results, baseline=None):
+    base = {r['name']: r for r in baseline or []}
+    print(f"{'benchmark':<44}{'ops/s':>12}{'p50 us':>10}{'p99 us':>10}{'vs base':>10}")
+    for r in results:
+        delta = ''
+        if r['name'] in base:
+            delta = f"{(r['p50_us'] / base[r['name']]['p50_us'] - 1) * 100:+.1f}%"
+        print(f"{r['name']:<44}{r['throughput_per_s']:>12.1f}{r['p50_us']:>10.1f}"
+              f"{r['p99_us']:>10.1f}{delta:>10}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--positions', help='attempt CSV with gps_latitude/gps_longitude/gps_speed')
+    parser.add_argument('--densities', type=int, nargs='+', default=DENSITIES)
+    parser.add_argument('--out', default='racing_line_bench.json', help='results JSON path')
+    parser.add_argument('--compare', help='previous results JSON to compare p50 against')
+    args = parser.parse_args()
+
+    outline = racing_line.generate_default_racing_line()
+    positions_by_source = {'synthetic': None}
+    if args.positions:
+        positions_by_source['recorded'] = recorded_positions(args.positions, SAMPLES)
+        print(f"[INFO] {len(positions_by_source['recorded'])} recorded positions from {args.positions}")
+
+    server, url = start_server()
+    results = []
+    try:
+        for density in args.densities:
+            print(f"[RUN] Racing line density {density} points...")
+            results.extend(bench_density(density, outline, positions_by_source, url))
+    finally:
+        server.shutdown()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)['results']
+    print()
+    print_table(results, baseline)
+
+    with open(args.out, 'w') as f:
+        json.dump({
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'results': results
+        }, f, indent=2)
+    print(f"\n[OK] Results written to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,500 @@
+"""
+PSU Racing - Trackside Racing Line Server
+Serves the /api/racing_line contract locally when connectivity to Vercel is poor.
+
+Runs the same request processing as api/racing_line.py on an asyncio HTTP/1.1
+server with keep-alive, so many phones can hold connections open at once.
+The racing line is loaded once at startup and shared by every request;
+overlay computation runs on a thread pool so the event loop stays responsive.
+
+Streaming: instead of POSTing every telemetry tick, a client can open
+    GET /api/racing_line/stream?camera_width=1280&camera_height=720&camera=gopro
+as Server-Sent Events and receive an overlay result for every new car
+position. Positions come from MQTT (car/telemetry, car/pi_gps) with --mqtt,
+or are POSTed to /api/racing_line/telemetry (?topic=car/pi_gps) as a local
+stand-in for the broker. A client that falls behind only gets the latest
+position; intermediate ones are coalesced away. Add &latency_ms=<expected
+delivery latency> to draw each overlay for the predicted pose.
+
+Usage:
+    py scripts/trackside_server.py
+    py scripts/trackside_server.py --port 8080 --workers 4
+    py scripts/trackside_server.py --mqtt
+    py scripts/trackside_server.py --mqtt --mqtt-broker localhost --mqtt-port 1883 --no-tls
+
+Then point the dashboard at it:
+    const RACING_LINE_API = "http://<laptop-ip>:8080/api/racing_line";
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import racing_line
+
+try:
+    import paho.mqtt.client as mqtt
+except ImportError:
+    mqtt = None  # Only needed for --mqtt
+
+API_PATH = '/api/racing_line'
+KEEPALIVE_TIMEOUT_S = 30    # Idle keep-alive connections are closed after this
+MAX_HEADER_BYTES = 16384
+MAX_BODY_BYTES = 64 << 20   # Batch requests for a whole attempt can be large
+
+# MQTT settings (same broker as the dashboard)
+MQTT_BROKER = "8fac0c92ea0a49b8b56f39536ba2fd78.s1.eu.hivemq.cloud"
+MQTT_PORT = 8883
+MQTT_USER = "ShellJM"
+MQTT_PASS = "psuEcoteam1st"
+MQTT_TOPICS = {"car/telemetry": "telemetry", "car/pi_gps": "pi_gps"}
+
+STREAM_HEARTBEAT_S = 15     # SSE comment sent when idle to keep proxies open
+HEADING_MIN_MOVE_M = 0.5    # Movement needed before re-deriving heading from fixes
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+           413: 'Payload Too Large', 431: 'Request Header Fields Too Large'}
+
+class BadRequest(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+# ============== HTTP/1.1 ==============
+async def read_request(reader):
+    """
+    Read one request. Returns (method, target, version, headers, body),
+    or None when the client closed the connection or went idle.
+    """
+    try:
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEPALIVE_TIMEOUT_S)
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+        return None
+    except asyncio.LimitOverrunError:
+        raise BadRequest(431, 'request headers too large')
+    if len(head) > MAX_HEADER_BYTES:
+        raise BadRequest(431, 'request headers too large')
+
+    lines = head.decode('latin-1').split('\r\n')
+    try:
+        method, target, version = lines[0].split(' ', 2)
+    except ValueError:
+        raise BadRequest(400, 'malformed request line')
+
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise BadRequest(400, 'chunked request bodies are not supported')
+    try:
+        length = int(headers.get('content-length') or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise BadRequest(400, 'invalid Content-Length')
+    if length > MAX_BODY_BYTES:
+        raise BadRequest(413, 'request body too large')
+    body = await reader.readexactly(length) if length else b''
+    return method, target, version, headers, body
+
+def wants_keep_alive(version, headers):
+    connection = headers.get('connection', '').lower()
+    if version == 'HTTP/1.0':
+        return connection == 'keep-alive'
+    return connection != 'close'
+
+async def write_response(writer, loop, pool, version, status, headers, chunks, keep_alive):
+    """
+    Write a response. Lists of chunks get a Content-Length; generators
+    (streamed batches) are pulled on the pool and sent chunked.
+    """
+    streamed = not isinstance(chunks, (list, tuple))
+    head = [f'HTTP/1.1 {status} {REASONS.get(status, "")}']
+    head += [f'{name}: {value}' for name, value in headers]
+
+    if not streamed:
+        body = b''.join(chunks)
+        head.append(f'Content-Length: {len(body)}')
+    elif version == 'HTTP/1.0':
+        keep_alive = False  # Close-delimited body
+    else:
+        head.append('Transfer-Encoding: chunked')
+    head.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+
+    if not streamed:
+        writer.write(body)
+    else:
+        chunks = iter(chunks)
+        while True:
+            chunk = await loop.run_in_executor(pool, next, chunks, None)
+            if chunk is None:
+                break
+            if version == 'HTTP/1.0':
+                writer.write(chunk)
+            elif chunk:
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk))
+            await writer.drain()
+        if version != 'HTTP/1.0':
+            writer.write(b'0\r\n\r\n')
+    await writer.drain()
+    return keep_alive
+
+# ============== OVERLAY STREAMING ==============
+class Subscriber:
+    """One SSE client. Holds only the latest unsent sample (coalescing)."""
+
+    ids = itertools.count(1)
+
+    def __init__(self, source, cam_width, cam_height):
+        self.id = next(self.ids)
+        self.source = source
+        self.cam_width = cam_width
+        self.cam_height = cam_height
+        self.latest = None
+        self.event = asyncio.Event()
+        self.closed = False
+        self.sent = 0
+        self.coalesced = 0
+
+class OverlayHub:
+    """
+    Fans car positions out to SSE subscribers. publish() must run on the
+    event loop; MQTT callbacks use publish_threadsafe().
+    """
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.subscribers = set()
+        self.last_fix = {}      # source -> (lat, lon, heading) for deriving heading
+        self.received = 0
+        self.rejected = 0       # MQTT payloads dropped by normalize()
+
+    def normalize(self, source, payload):
+        """
+        Telemetry or Pi GPS payload -> overlay sample, or None if no fix.
+        Numeric strings are accepted (as the dashboard's num()); anything
+        else non-numeric or non-finite raises ValueError.
+        """
+        lat = payload.get('latitude') or 0
+        lon = payload.get('longitude') or 0
+        if not lat or not lon:
+            return None
+        lat, lon = finite(lat, 'latitude'), finite(lon, 'longitude')
+        if not lat or not lon:
+            return None
+        speed = finite(payload.get('speed', payload.get('speed_kmh', 0)) or 0, 'speed')
+
+        # car/telemetry has no heading: use the bearing between fixes like the dashboard
+        heading = payload.get('heading')
+        if heading is not None:
+            heading = finite(heading, 'heading')
+        prev = self.last_fix.get(source)
+        anchor = (lat, lon)
+        if heading is None:
+            heading = prev[2] if prev else 0  # Stationary: keep the previous heading
+            if prev and racing_line.haversine(prev[0], prev[1], lat, lon) * 1000 >= HEADING_MIN_MOVE_M:
+                heading = bearing(prev[0], prev[1], lat, lon)
+            elif prev:
+                anchor = prev[:2]  # Measure the next move from the last moving fix
+        self.last_fix[source] = (anchor[0], anchor[1], heading)
+
+        return {'latitude': lat, 'longitude': lon, 'heading': heading, 'speed': speed,
+                'received': time.time()}
+
+    def publish(self, topic, payload):
+        source = MQTT_TOPICS.get(topic, topic)
+        sample = self.normalize(source, payload)
+        if sample is None:
+            return
+        self.received += 1
+        racing_line.METRICS.incr('stream_samples')
+        for subscriber in self.subscribers:
+            if subscriber.source in ('any', source):
+                if subscriber.latest is not None:
+                    subscriber.coalesced += 1
+                    racing_line.METRICS.incr('stream_coalesced')
+                subscriber.latest = sample
+                subscriber.event.set()
+
+    def publish_threadsafe(self, topic, payload):
+        self.loop.call_soon_threadsafe(self.publish_or_skip, topic, payload)
+
+    def publish_or_skip(self, topic, payload):
+        """publish() for MQTT callbacks: a bad payload is counted, not raised into the loop."""
+        try:
+            self.publish(topic, payload)
+        except (ValueError, TypeError, AttributeError) as e:
+            self.rejected += 1
+            if self.rejected == 1 or self.rejected % 100 == 0:
+                print(f"[MQTT] Skipping bad payload on {topic} ({self.rejected} so far): {e}")
+
+def finite(value, name):
+    """float(value), raising ValueError unless it is a finite number."""
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{name} must be a number')
+    if not math.isfinite(value):
+        raise ValueError(f'{name} must be finite')
+    return value
+
+def bearing(lat1, lon1, lat2, lon2):
+    """Compass bearing between two fixes, as app/script.js calculateHeading."""
+    lat1, lon1, lat2, lon2 = map(math.radians, [lat1, lon1, lat2, lon2])
+    x = math.sin(lon2 - lon1) * math.cos(lat2)
+    y = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2 - lon1)
+    return (math.degrees(math.atan2(x, y)) + 360) % 360
+
+async def watch_disconnect(reader, subscriber):
+    """Wake the stream when the client goes away, even if no samples arrive."""
+    try:
+        while await reader.read(4096):
+            pass  # SSE clients send nothing after the request
+    except ConnectionError:
+        pass
+    subscriber.closed = True
+    subscriber.event.set()
+
+async def stream_overlays(reader, writer, loop, pool, hub, target):
+    """Serve an SSE stream of overlay results until the client disconnects."""
+    query = parse_qs(urlparse(target).query)
+    track_id = query.get('track', [None])[0]
+    track_version = query.get('track_version', [None])[0]
+    camera = query.get('camera', [None])[0]
+    try:
+        subscriber = Subscriber(
+            query.get('source', ['any'])[0],
+            int(query.get('camera_width', [1280])[0]),
+            int(query.get('camera_height', [720])[0])
+        )
+        # With latency_ms, draw for the pose predicted when the client shows it
+        latency_ms = query.get('latency_ms', [None])[0]
+        if latency_ms is not None:
+            latency_ms = float(latency_ms)
+            if not math.isfinite(latency_ms):
+                raise ValueError(f'invalid latency_ms {latency_ms}')
+        await loop.run_in_executor(pool, racing_line.get_track, track_id, track_version)
+        if camera is not None:
+            racing_line.CAMERA_LUTS.get(camera, subscriber.cam_width, subscriber.cam_height)
+    except (LookupError, ValueError) as e:
+        error = json.dumps({'error': str(e)}).encode()
+        await write_response(writer, loop, pool, 'HTTP/1.1', 400,
+                             [('Content-Type', 'application/json')], [error], False)
+        return
+    session_id = f'stream-{subscriber.id}'
+
+    head = ['HTTP/1.1 200 OK', 'Content-Type: text/event-stream',
+            'Cache-Control: no-cache', 'Connection: close']
+    head += [f'{name}: {value}' for name, value in racing_line.CORS_HEADERS]
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1'))
+    await writer.drain()
+
+    hub.subscribers.add(subscriber)
+    watcher = asyncio.ensure_future(watch_disconnect(reader, subscriber))
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(subscriber.event.wait(), STREAM_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                writer.write(b': ping\n\n')
+                await writer.drain()
+                continue
+
+            if subscriber.closed:
+                break
+            subscriber.event.clear()
+            sample, subscriber.latest = subscriber.latest, None
+            try:
+                result = await loop.run_in_executor(
+                    pool, racing_line.calculate_overlay,
+                    sample['latitude'], sample['longitude'], sample['heading'], sample['speed'],
+                    subscriber.cam_width, subscriber.cam_height, session_id,
+                    track_id, track_version, camera,
+                    sample['received'] if latency_ms is not None else None, latency_ms)
+            except Exception as e:
+                # One bad sample must not end the stream
+                racing_line.METRICS.incr('errors')
+                writer.write(f'event: error\ndata: {json.dumps({"error": str(e)})}\n\n'.encode())
+                await writer.drain()
+                continue
+            subscriber.sent += 1
+            racing_line.METRICS.incr('stream_sent')
+            writer.write(f'data: {json.dumps(result)}\n\n'.encode())
+            await writer.drain()
+    finally:
+        hub.subscribers.discard(subscriber)
+        watcher.cancel()
+
+def start_mqtt_bridge(hub, broker, port, username=None, password=None, tls=True,
+                      client_factory=None):
+    """
+    Subscribe to car position topics and feed them into the hub. Any object
+    with paho's client interface works, so tests can pass a stand-in.
+    """
+    if client_factory is None:
+        if mqtt is None:
+            raise RuntimeError('paho-mqtt is required for --mqtt (pip install paho-mqtt)')
+        client_factory = lambda: mqtt.Client(client_id=f"trackside_{int(time.time())}")
+
+    client = client_factory()
+    if username:
+        client.username_pw_set(username, password)
+    if tls:
+        client.tls_set()
+
+    def on_connect(client, userdata, flags, rc):
+        if rc == 0:
+            print("[MQTT] Connected to broker")
+            for topic in MQTT_TOPICS:
+                client.subscribe(topic)
+        else:
+            print(f"[MQTT] Connection failed: {rc}")
+
+    def on_message(client, userdata, msg):
+        try:
+            hub.publish_threadsafe(msg.topic, json.loads(msg.payload))
+        except (ValueError, AttributeError):
+            pass  # Skip malformed payloads
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(broker, port, 60)
+    client.loop_start()
+    print(f"[MQTT] Connecting to {broker}:{port}...")
+    return client
+
+# ============== ROUTING ==============
+async def dispatch(loop, pool, hub, method, target, headers, body):
+    """Route a request to the shared racing line processing."""
+    url = urlparse(target)
+    path = url.path.rstrip('/')
+    if not path.startswith(API_PATH) and path != '/metrics':
+        return 404, [('Content-Type', 'application/json')], [b'{"error": "not found"}']
+
+    # Local stand-in for the MQTT feed
+    if method == 'POST' and path == API_PATH + '/telemetry':
+        topic = parse_qs(url.query).get('topic', ['car/telemetry'])[0]
+        try:
+            hub.publish(topic, json.loads(body))
+        except (ValueError, TypeError, AttributeError) as e:
+            return 400, [('Content-Type', 'application/json')], [json.dumps({'error': str(e)}).encode()]
+        stats = {'received': hub.received, 'subscribers': len(hub.subscribers)}
+        return 200, [('Content-Type', 'application/json')] + racing_line.CORS_HEADERS, \
+            [json.dumps(stats).encode()]
+
+    if method == 'POST':
+        return await loop.run_in_executor(
+            pool, racing_line.process_post, body, headers.get('accept'))
+    if method == 'GET':
+        return racing_line.process_get(target)
+    if method == 'OPTIONS':
+        return 200, racing_line.PREFLIGHT_HEADERS, []
+    return 405, [('Content-Type', 'application/json')], [b'{"error": "method not allowed"}']
+
+def make_connection_handler(pool, hub):
+    async def handle_connection(reader, writer):
+        loop = asyncio.get_running_loop()
+        try:
+            keep_alive = True
+            while keep_alive:
+                try:
+                    request = await read_request(reader)
+                except BadRequest as e:
+                    error = ('{"error": "%s"}' % e).encode()
+                    await write_response(writer, loop, pool, 'HTTP/1.1', e.status,
+                                         [('Content-Type', 'application/json')], [error], False)
+                    break
+                if request is None:
+                    break
+
+                start = time.perf_counter()
+                method, target, version, headers, body = request
+                if method == 'GET' and urlparse(target).path.rstrip('/') == API_PATH + '/stream':
+                    await stream_overlays(reader, writer, loop, pool, hub, target)
+                    break
+
+                status, response_headers, chunks = await dispatch(
+                    loop, pool, hub, method, target, headers, body)
+                keep_alive = await write_response(
+                    writer, loop, pool, version, status, response_headers, chunks,
+                    wants_keep_alive(version, headers))
+                if method == 'POST' and status == 200:
+                    racing_line.METRICS.observe('total', time.perf_counter() - start)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle_connection
+
+# ============== MAIN ==============
+async def serve(host, port, workers, mqtt_args=None):
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='overlay')
+    hub = OverlayHub(asyncio.get_running_loop())
+    if mqtt_args:
+        start_mqtt_bridge(hub, **mqtt_args)
+
+    server = await asyncio.start_server(make_connection_handler(pool, hub), host, port,
+                                        limit=MAX_HEADER_BYTES)
+    print(f"[HTTP] Racing line API on http://{host}:{port}{API_PATH} ({workers} workers)")
+    print(f"[HTTP] Overlay stream (SSE) on http://{host}:{port}{API_PATH}/stream")
+    print(f"[HTTP] Metrics on http://{host}:{port}{API_PATH}/metrics")
+    print("\nPress Ctrl+C to stop.\n")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        pool.shutdown(wait=False)
+
+def main():
+    parser = argparse.ArgumentParser(description='Standalone trackside racing line server')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                        help='threads for overlay computation')
+    parser.add_argument('--mqtt', action='store_true',
+                        help='stream overlays from car/telemetry and car/pi_gps')
+    parser.add_argument('--mqtt-broker', default=MQTT_BROKER)
+    parser.add_argument('--mqtt-port', type=int, default=MQTT_PORT)
+    parser.add_argument('--no-tls', action='store_true', help='plain MQTT, e.g. a local broker')
+    args = parser.parse_args()
+
+    mqtt_args = None
+    if args.mqtt:
+        local = args.mqtt_broker != MQTT_BROKER
+        mqtt_args = {
+            'broker': args.mqtt_broker,
+            'port': args.mqtt_port,
+            'username': None if local else MQTT_USER,
+            'password': None if local else MQTT_PASS,
+            'tls': not args.no_tls
+        }
+
+    print("=" * 50)
+    print("  PSU Racing - Trackside Racing Line Server")
+    print("=" * 50)
+
+    # Load once; every request shares this geometry
+    track = racing_line.get_track()
+    print(f"[TRACK] {len(track) if track else 0} racing line points ready")
+
+    asyncio.run(serve(args.host, args.port, args.workers, mqtt_args))
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\n[STOP] Server stopped")
@@ -0,0 +1,73 @@
+"""
+Checks for pi_scripts/gps_sync_streamer.py that run without the Pi: the
+spool and publisher with a stand-in MQTT client, and the NMEA parser on
+synthetic recordings. Skipped where the Pi's packages aren't installed.
+"""
+
+import json
+import os
+import sys
+from datetime import datetime, timezone
+
+import pytest
+
+for module in ('cv2', 'serial', 'flask', 'paho.mqtt.client'):
+    pytest.importorskip(module)
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'pi_scripts'))
+
+import gps_sync_streamer as gss
+
+class Delivered:
+    rc = 0
+
+    def is_published(self):
+        return True
+
+class LocalClient:
+    """Connected stand-in for paho's client that acknowledges every publish."""
+
+    def __init__(self):
+        self.messages = []
+
+    def is_connected(self):
+        return True
+
+    def publish(self, topic, payload, qos=0):
+        self.messages.append((topic, payload))
+        return Delivered()
+
+def test_spool_survives_torn_last_line(tmp_path):
+    spool = gss.Spool(str(tmp_path), segment_samples=4)
+    for k in range(10):
+        spool.append({'k': k})
+    spool.writer.close()
+    with open(spool.segments[-1][0], 'ab') as f:
+        f.write(b'{"k": 10, "lat')  # Power cut mid-write
+
+    spool = gss.Spool(str(tmp_path), segment_samples=4)
+    assert len(spool) == 10
+    publisher = gss.GPSPublisher(LocalClient(), spool)
+    for _ in range(20):
+        if not publisher.drain(0.0):
+            break
+    samples = [s['k'] for _, payload in publisher.client.messages
+               for s in json.loads(payload)['samples']]
+    assert samples == list(range(10))
+    assert len(spool) == 0 and spool.corrupt == 1
+
+@pytest.mark.parametrize('rmc_first', [False, True])
+def test_nmea_date_across_midnight(rmc_first):
+    state = gss.GPSState()
+    parser = gss.NMEAParser(state)
+    start = 86400 - 2  # 2026-10-18 23:59:58 UTC
+    parser.feed(gss.synthetic_nmea(seconds=5, rate_hz=1, corrupt_every=0,
+                                   start=start, rmc_first=rmc_first))
+
+    base = datetime(2026, 10, 18, tzinfo=timezone.utc).timestamp()
+    history = state.history
+    times = [history.fixes[(history.start + k) % history.capacity, history.GPS_TIME] - base
+             for k in range(history.count)]
+    assert times == [start + k for k in range(5)]
+    assert state.gps_time - base == start + 4
+    assert parser.corrupt == parser.malformed == 0
@@ -0,0 +1,44 @@
+"""
+Checks for api/racing_line.py. Run from the repository root:
+    python -m pytest -q tests
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'api'))
+
+import numpy as np
+import racing_line
+
+def car_poses(step=97):
+    """(lat, lon, heading, speed) samples along the loaded racing line, facing along it."""
+    track = racing_line.get_track()
+    poses = []
+    for i in range(0, len(track), step):
+        j = (i + 5) % len(track)
+        heading = np.degrees(np.arctan2(track.east[j] - track.east[i], track.north[j] - track.north[i]))
+        # A little off the line, so deviation and projection are not trivial
+        poses.append((float(track.lat[i]) + 2e-5, float(track.lon[i]) - 1e-5,
+                      float(heading) % 360, 20.0 + i % 15))
+    return poses
+
+def test_scalar_and_vectorised_pixels_match():
+    track = racing_line.get_track()
+    for lat, lon, heading, _ in car_poses():
+        scalar = [racing_line.gps_to_pixel(float(track.lat[i]), float(track.lon[i]), lat, lon, heading)
+                  for i in range(len(track))]
+        vector = racing_line.gps_to_pixels(track.lat, track.lon, lat, lon, heading)
+        assert vector.tolist() == [list(p) for p in scalar if p is not None]
+
+def test_batch_matches_single_samples():
+    racing_line.RESPONSE_CACHE.clear()
+    samples = [{'latitude': lat, 'longitude': lon, 'heading': heading, 'speed': speed}
+               for lat, lon, heading, speed in car_poses()]
+    single = [racing_line.calculate_overlay(s['latitude'], s['longitude'], s['heading'], s['speed'])
+              for s in samples]
+    assert any(result['overlay_points'] for result in single)
+    assert racing_line.calculate_overlay_batch(samples) == single
+    # Chunk boundaries must not change anything
+    chunked = [r for part in racing_line.iter_overlay_batch(samples, chunk=3) for r in part]
+    assert chunked == single
@@ -0,0 +1,97 @@
+"""
+Compile app/ideal_racing_line.json into the precomputed artifact the
+racing line API loads at cold start (api/ideal_racing_line.npz), and every
+registry track app/tracks/<track_id>/<version>.json into
+api/tracks/<track_id>/<version>.npz.
+
+Run after every change to the racing line JSON:
+    python utils/build_racing_line.py
+    python utils/build_racing_line.py --check   # fail if the artifact is stale
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'api'))
+
+import numpy as np
+import racing_line
+
+JSON_PATH = os.path.join(ROOT, 'app', 'ideal_racing_line.json')
+ARTIFACT_PATH = os.path.join(ROOT, 'api', racing_line.RACING_LINE_ARTIFACT)
+TRACKS_SRC = os.path.join(ROOT, 'app', racing_line.TRACKS_DIR)
+TRACKS_OUT = os.path.join(ROOT, 'api', racing_line.TRACKS_DIR)
+
+def sources():
+    """(json_path, artifact_path) for the default line and every registry track."""
+    pairs = [(JSON_PATH, ARTIFACT_PATH)]
+    if os.path.isdir(TRACKS_SRC):
+        for track_id in sorted(os.listdir(TRACKS_SRC)):
+            track_dir = os.path.join(TRACKS_SRC, track_id)
+            if not os.path.isdir(track_dir):
+                continue
+            for name in sorted(os.listdir(track_dir)):
+                version, ext = os.path.splitext(name)
+                if ext == '.json':
+                    pairs.append((os.path.join(track_dir, name),
+                                  os.path.join(TRACKS_OUT, track_id, version + '.npz')))
+    return pairs
+
+def check():
+    """Exit non-zero if any artifact is missing or built from other JSON."""
+    stale = 0
+    for json_path, artifact_path in sources():
+        if not os.path.isfile(artifact_path):
+            print(f"[ERROR] {artifact_path} not found")
+            stale += 1
+            continue
+        with open(json_path, 'rb') as f:
+            source_sha256 = hashlib.sha256(f.read()).hexdigest()
+        with np.load(artifact_path, allow_pickle=False) as data:
+            built_from = str(data['source_sha256'])
+            version = int(data['version'])
+        if built_from != source_sha256 or version != racing_line.ARTIFACT_VERSION:
+            print(f"[ERROR] {artifact_path} is stale")
+            stale += 1
+    if stale:
+        print("[ERROR] Run: python utils/build_racing_line.py")
+        return 1
+    print("[OK] Artifacts are up to date")
+    return 0
+
+def build():
+    for json_path, artifact_path in sources():
+        print(f"Compiling {json_path}...")
+        os.makedirs(os.path.dirname(artifact_path), exist_ok=True)
+        track, segments = racing_line.compile_racing_line(json_path, artifact_path)
+        print(f"[OK] {track.source_count} source points -> {len(track)} points "
+              f"at {track.lap_length / len(track):.2f} m, lap {track.lap_length:.1f} m, "
+              f"{len(segments)} segments")
+        print(f"[OK] Wrote {artifact_path} ({os.path.getsize(artifact_path) / 1024:.1f} KB)")
+
+    # Compare load times (best of several runs)
+    artifact_ms = best_ms(lambda: racing_line.load_racing_line_artifact(ARTIFACT_PATH))
+    json_ms = best_ms(lambda: racing_line.TrackGeometry.from_racing_line(
+        json.load(open(JSON_PATH, 'r'))['racing_line']))
+    print(f"[INFO] Load time: artifact {artifact_ms:.1f} ms, JSON {json_ms:.1f} ms (warm)")
+    # A cold start also pays for np.load importing zipfile, so small lines load from the JSON
+    source = 'artifact' if racing_line.prefer_artifact(JSON_PATH) else 'JSON'
+    print(f"[INFO] Cold start uses the {source} (artifact from "
+          f"{racing_line.ARTIFACT_MIN_JSON_BYTES // 1024} KB of JSON)")
+
+def best_ms(fn, runs=5):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    return min(times)
+
+if __name__ == "__main__":
+    if '--check' in sys.argv:
+        sys.exit(check())
+    build()